@@ -21,12 +21,40 @@ def main():
         1: ("download_filings", lambda: s.step_01_download_filings(ciks)),
         2: ("clean_filings", lambda: s.step_02_clean_filings(ciks)),
         3: ("extract_item1a", lambda: s.step_03_extract_item1a(ciks)),
-        4: ("compute_features", lambda: s.step_04_compute_features(ciks)),
+        4: ("compute_features", lambda: s.step_04_compute_features(ciks, force=args.force)),
         5: ("pull_returns", s.step_05_pull_returns),
         6: ("build_panel", s.step_06_build_panel),
         7: ("run_models", s.step_07_run_models),
     }
 
+    if args.manifest:
+        steps[1] = ("download_missing_filings", lambda: s.step_01_download_missing(ciks, args.start_year, args.end_year))
+
+    if args.refresh_returns:
+        steps[5] = ("refresh_returns", s.step_05_refresh_returns)
+
+    if args.event_returns:
+        (name_5, monthly), (name_6, panel) = steps[5], steps[6]
+
+        def returns_and_daily():
+            monthly()
+            s.step_05_pull_daily_returns()
+
+        def panel_and_events():
+            panel()
+            s.step_06_event_returns()
+
+        steps[5] = (f"{name_5}+pull_daily_returns", returns_and_daily)
+        steps[6] = (f"{name_6}+event_returns", panel_and_events)
+
+    if args.items:
+        items = [i.strip() for i in args.items.split(",") if i.strip()]
+        steps[3] = ("extract_items", lambda: s.step_03_extract_items(ciks, items))
+
+    if args.fused:
+        steps[2] = ("clean_and_extract_item1a", lambda: s.step_02_03_clean_and_extract(ciks, keep_cleaned=args.keep_cleaned))
+        steps[3] = ("extract_item1a", lambda: print("Done in step 2 (--fused)"))
+
     print(f"Running pipeline for: {('ALL CIKs' if ciks is None else f'{len(ciks)} CIK(s)')}")
 
     if args.from_step > args.to_step:
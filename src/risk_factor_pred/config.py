@@ -13,9 +13,11 @@ PROCESSED_DIR = DATA_DIR / "processed"
 
 RAW_EDGAR_DIR = RAW_DIR / "sec-edgar-filings"
 RAW_CIKS_DIR = RAW_DIR / "ciks_index"
+RAW_MASTER_IDX_DIR = RAW_CIKS_DIR / "master_idx"
 INTERIM_CLEANED_DIR = INTERIM_DIR / "cleaned_filings"
 INTERIM_ITEM1A_DIR = INTERIM_DIR / "item1a"
 INTERIM_FEATURES_DIR = INTERIM_DIR / "text_features"
+INTERIM_TOKENS_DIR = INTERIM_DIR / "tokens"
 INTERIM_RETURNS_DIR = INTERIM_DIR / "returns"
 
 PROCESSED_PANEL_DIR = PROCESSED_DIR / "panel"
@@ -23,25 +25,57 @@ PROCESSED_PANEL_DIR = PROCESSED_DIR / "panel"
 # ------------------------------------------------------ 
 
 CIK_LIST = RAW_CIKS_DIR / "cik_list.csv"                                     # csv containing list of CIKS
+DOWNLOAD_MANIFEST = RAW_DIR / "download_manifest.csv"                        # accessions in master.idx but not under RAW_EDGAR_DIR (edgar.manifest)
 
-FEATURES_FILE = INTERIM_FEATURES_DIR / "features.csv"
-RETURNS_FILE = INTERIM_RETURNS_DIR / "returns.csv"
-FINAL_DATASET = PROCESSED_PANEL_DIR / "final_dataset.csv"
+FEATURES_FILE = INTERIM_FEATURES_DIR / "features.csv"                        # step 04 checkpoint, appended as pairs complete (text.feature_store)
+FEATURES_STORE = INTERIM_FEATURES_DIR / "features"                           # typed Parquet copy of FEATURES_FILE, partitioned by filing year (datasets.storage)
+FEATURES_FAILURES_FILE = INTERIM_FEATURES_DIR / "features_failures.jsonl"     # one JSON line per failed pair/CIK, with traceback
+RETURNS_FILE = INTERIM_RETURNS_DIR / "returns.csv"                           # legacy CSV, read only when there is no RETURNS_CACHE
+RETURNS_CACHE = INTERIM_RETURNS_DIR / "returns.parquet"                      # monthly returns, one row per (cik, date) (wrds.crsp_returns)
+RETURNS_LINKS = INTERIM_RETURNS_DIR / "crsp_links.parquet"                   # CCM link rows of the last pull, to detect link changes
+RETURNS_DAILY_DIR = INTERIM_RETURNS_DIR / "daily"                            # daily returns, one Parquet partition per batch of CIKs (wrds.crsp_returns)
+MARKET_DAILY_FILE = INTERIM_RETURNS_DIR / "market_daily.parquet"             # daily market returns (crsp.dsi); its dates are the trading calendar
+FILINGS_INDEX = INTERIM_DIR / "filings.sqlite"                               # accession, cik, form, filed/period dates, file sizes (edgar.filing_index)
+FINAL_DATASET = PROCESSED_PANEL_DIR / "final_dataset"                        # Parquet, partitioned by filing year (datasets.storage)
+EVENT_RETURNS_FILE = PROCESSED_PANEL_DIR / "event_returns"                   # CARs around each feature row's date_a, partitioned by filing year (datasets.event_study)
 
 # ---------- SETTINGS ----------
 FORM       = "10-K"                                                 # or "10-K", "10-KT", etc.
 START_DATE = "2006-01-01"                                           # filings per CIK, only released after 2006
 MAX_WORKERS = 16                                                     # number of threads
+DOWNLOADER = "pooled"                                               # "pooled" (shared rate limit, keep-alive) or "sec-edgar-downloader"
+SEC_USER_AGENT = "MyCompanyName my.email@domain.com"                # SEC asks for a name and contact email
+SEC_REQUESTS_PER_SECOND = 9                                         # shared by all download threads; SEC allows 10, one less absorbs network jitter
+DOWNLOAD_RETRIES = 5                                                # retries on 429/5xx and dropped connections
+CLEANER = "fused"                                                   # "fused" (few merged passes) or "reference" (clean_html)
+CLEAN_EXECUTOR = "process"                                          # "process" (batched filings) or "thread" (one task per CIK)
+CLEAN_BATCH_SIZE = 8                                                # filings per process-pool task in step 02
+CLEAN_MAX_TASKS_PER_CHILD = 25                                      # recycle cleaning workers after this many batches (Python 3.11+)
+FUSED_KEEP_CLEANED = False                                          # fused steps 02+03: also write the full cleaned filing to INTERIM_CLEANED_DIR
+RETURNS_START_DATE = "2006-01-01"                                   # first month of CRSP returns pulled in step 05
+RETURNS_END_DATE = None                                             # last month ("yyyy-mm-dd"), None = latest month in CRSP
+CRSP_BATCH_SIZE = 500                                               # CIKs per CRSP query in step 05 (None = one query per CIK)
+RETURNS_DORMANT_MONTHS = 12                                         # refresh skips CIKs whose last cached month is this far behind the latest one
+RETURN_HORIZONS = [("future", 18), ("past", 12)]                    # (period, months) window returns added to the panel in step 06
+WINDOW_RETURN_ENGINE = "prefix"                                     # "prefix" (sorted prefix sums + searchsorted) or "merge" (cartesian merge, reference)
+CRSP_DAILY_BATCH_SIZE = 100                                         # CIKs per crsp.dsf query and per daily Parquet partition
+MARKET_INDEX = "vwretd"                                             # crsp.dsi market return: "vwretd", "ewretd" or "sprtrn"
+EVENT_WINDOWS = [(-1, 1), (2, 60)]                                  # CAR windows in trading days around the filing (day 0 = date_a or next trading day)
+EVENT_MIN_COVERAGE = 0.8                                            # share of a window's trading days with a stock return, else the CAR is NaN
+LEVENSHTEIN_ENGINE = "bitparallel"                                  # "bitparallel", "banded" (fast for near-identical pairs) or "reference" (pure-Python DP, slow)
+LEVENSHTEIN_MAX_DISTANCE = None                                     # int cutoff: distances >= cutoff are reported as the cutoff (None = exact)
 # -------------------------------
 
 def ensure_project_dirs() -> None:
     for p in [
         RAW_EDGAR_DIR,
         RAW_CIKS_DIR,
+        RAW_MASTER_IDX_DIR,
 
         INTERIM_CLEANED_DIR,
         INTERIM_ITEM1A_DIR,
         INTERIM_FEATURES_DIR,
+        INTERIM_TOKENS_DIR,
         INTERIM_RETURNS_DIR,
 
         PROCESSED_PANEL_DIR
@@ -49,4 +83,4 @@ def ensure_project_dirs() -> None:
         p.mkdir(parents=True, exist_ok=True)
 
 
-FEATURES_FIELDS = ["cik", "date_a", "date_b", "distance", "levenshtein", "len_a", "len_b", "sentiment"]
\ No newline at end of file
+FEATURES_FIELDS = ["cik", "date_a", "date_b", "distance", "distance_capped", "levenshtein", "len_a", "len_b", "sentiment", "digest_a", "digest_b"]
\ No newline at end of file
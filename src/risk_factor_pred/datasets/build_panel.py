@@ -1,4 +1,6 @@
+from risk_factor_pred.config import WINDOW_RETURN_ENGINE, RETURN_HORIZONS
 import pandas as pd
+import numpy as np
 
 def datatype_setup(sim_df, return_df):
     """
@@ -13,10 +15,13 @@ def datatype_setup(sim_df, return_df):
     return_df['retPlusOne'] = return_df['ret'] + 1
     return sim_df, return_df
 
-def merge_return(sim_df, return_df, months, period):
+def merge_return_reference(sim_df, return_df, months, period):
     """
     Merge feature rows with returns and compute window returns (past or future)
     over a `months` horizon, compounding `retPlusOne` within the window.
+
+    Reference implementation: joins every feature row with the firm's whole
+    return history before filtering to the window.
     """
     if period == 'future':
         sim_df["start_anchor"] = (sim_df["date_a"] + pd.offsets.MonthBegin(1)).dt.normalize()
@@ -53,3 +58,187 @@ def merge_return(sim_df, return_df, months, period):
     sim_df = sim_df.dropna(subset=[f"{period}_{months}m_ret"])
 
     return sim_df.drop(columns=['start_anchor','end_anchor','sim_idx'])
+
+# --------------------------------------------------------------------------------------------------------------------
+#                                                PREFIX-SUM WINDOW RETURNS
+# --------------------------------------------------------------------------------------------------------------------
+
+# dates are keyed in seconds since 1900 (33 bits) next to the CIK code
+_EPOCH = np.datetime64("1900-01-01T00:00:00", "s")
+_DATE_BITS = 33
+
+def _cik_codes(ciks):
+    """
+    Return (sorted unique 10-digit CIKs, code of each row into them), normalizing
+    each distinct value once instead of every row.
+    """
+    codes, uniques = pd.factorize(pd.Series(ciks), use_na_sentinel=False)
+    norm = pd.Series(uniques).astype(str).str.replace(r"\.0$", "", regex=True).str.zfill(10).to_numpy()
+    uniq, inverse = np.unique(norm, return_inverse=True)
+    return uniq, inverse[codes]
+
+def _normalize_cik(ciks) -> np.ndarray:
+    uniq, codes = _cik_codes(ciks)
+    return uniq[codes]
+
+def _seconds(dates, ceil: bool = False) -> np.ndarray:
+    """
+    Seconds since 1900 as int64 (rounded up with `ceil`), clipped to the key range.
+    """
+    ns = pd.to_datetime(dates).to_numpy(dtype="datetime64[ns]")
+    secs = (ns - _EPOCH.astype("datetime64[ns]")).astype("int64")
+    secs = -(-secs // 10**9) if ceil else secs // 10**9
+    return np.clip(secs, 0, (1 << _DATE_BITS) - 1)
+
+def build_return_index(return_df) -> dict:
+    """
+    Sort the returns once by (cik, date) and build prefix sums of log gross returns.
+
+    Returns a dict with the sorted unique CIKs, the sorted (cik, date) keys and the
+    prefix arrays used by `window_returns()`. Missing `retPlusOne` count as 1, as
+    in the groupby product of `merge_return_reference()`; zero gross returns are
+    counted separately so windows containing one compound to exactly 0.
+    """
+    uniq, codes = _cik_codes(return_df["cik"])
+    dates = pd.to_datetime(return_df["date"])
+    keys = (codes.astype("int64") << _DATE_BITS) | _seconds(dates)
+
+    has_date = dates.notna().to_numpy()
+    keys = keys[has_date]
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+
+    gross = np.nan_to_num(return_df["retPlusOne"].to_numpy(dtype="float64")[has_date][order], nan=1.0)
+    zero = gross == 0
+    logs = np.log(np.abs(np.where(zero, 1.0, gross)))
+    return {
+        "ciks": uniq,
+        "keys": keys,
+        "cum_log": np.concatenate([[0.0], np.cumsum(logs)]),
+        "cum_zero": np.concatenate([[0], np.cumsum(zero)]),
+        "cum_neg": np.concatenate([[0], np.cumsum(gross < 0)]),
+    }
+
+def _locate_ciks(index: dict, ciks):
+    """
+    Return (10-digit CIK of each row, key prefix of its CIK in `index`, whether `index` has the CIK).
+    """
+    query_uniq, query_codes = _cik_codes(ciks)
+    uniq = index["ciks"]
+    pos = np.searchsorted(uniq, query_uniq)
+    pos_in = np.minimum(pos, max(len(uniq) - 1, 0))
+    found = (pos < len(uniq)) & (uniq[pos_in] == query_uniq) if len(uniq) else np.zeros(len(query_uniq), bool)
+    base = pos_in[query_codes].astype("int64") << _DATE_BITS
+    return query_uniq[query_codes], base, found[query_codes]
+
+def _compound(index: dict, base, known, starts, ends) -> np.ndarray:
+    """
+    Compounded gross return over [start, end] for rows already located with `_locate_ciks()`.
+    """
+    lo = np.searchsorted(index["keys"], base | _seconds(starts, ceil=True), side="left")
+    hi = np.searchsorted(index["keys"], base | _seconds(ends), side="right")
+
+    gross = np.exp(index["cum_log"][hi] - index["cum_log"][lo])
+    gross[(index["cum_zero"][hi] - index["cum_zero"][lo]) > 0] = 0.0
+    negative = ((index["cum_neg"][hi] - index["cum_neg"][lo]) % 2) == 1
+    gross[negative] = -gross[negative]
+    gross[~known | (hi <= lo) | pd.isna(starts) | pd.isna(ends)] = np.nan
+    return gross
+
+def window_returns(index: dict, ciks, starts, ends) -> np.ndarray:
+    """
+    Compounded gross return over [start, end] (both inclusive) for each (cik, start, end),
+    from two `searchsorted` lookups per row. NaN where the window holds no return.
+    """
+    _, base, known = _locate_ciks(index, ciks)
+    return _compound(index, base, known, starts, ends)
+
+def _period_anchor(dates, period):
+    """
+    The fixed end of a window: the first day of the next month ('future', window start)
+    or the date itself ('past', window end).
+    """
+    dates = pd.Series(pd.to_datetime(dates))
+    if period == 'future':
+        return (dates + pd.offsets.MonthBegin(1)).dt.normalize()
+    if period == 'past':
+        return dates
+    raise ValueError(f"period must be 'future' or 'past', got {period!r}")
+
+def _spec_anchors(anchor, months, period):
+    if period == 'future':
+        return anchor.to_numpy(), (anchor + pd.offsets.DateOffset(months=months)).to_numpy()
+    return (anchor - pd.DateOffset(months=months)).to_numpy(), anchor.to_numpy()
+
+def window_anchors(dates, months, period):
+    """
+    Return the (start, end) anchors of the `months` window of `merge_return_reference()`.
+    """
+    return _spec_anchors(_period_anchor(dates, period), months, period)
+
+def merge_return_prefix(sim_df, return_df, months, period, index=None):
+    """
+    Same result as `merge_return_reference()` without the cartesian merge: returns are
+    sorted per CIK once (or `index` from `build_return_index()` is reused) and each
+    window return comes from prefix sums.
+    """
+    return add_window_returns(sim_df, return_df, [(period, months)], index=index)
+
+def add_window_returns(sim_df, return_df, specs, index=None, dropna: bool = True):
+    """
+    Add one `{period}_{months}m_ret` column per (period, months) spec in `specs`,
+    e.g. [("future", 18), ("past", 12)], in a single pass.
+
+    The returns are sorted and prefix-summed once (`build_return_index()`, or `index`)
+    and CIKs are normalized and located once, so each extra horizon only costs its
+    own date anchors and two `searchsorted` lookups. With `dropna`, rows missing any
+    of the new columns are dropped, as chaining `merge_return()` would; the index is
+    reset once, before the columns are added.
+    """
+    if index is None:
+        index = build_return_index(return_df)
+
+    sim_df = sim_df.reset_index(drop=True)
+    ciks, base, known = _locate_ciks(index, sim_df["cik"])
+    sim_df["cik"] = ciks.astype(object)
+
+    # visit rows in (cik, date) order: every horizon's anchors are then sorted too,
+    # which keeps the searchsorted lookups cache-friendly
+    dates = pd.to_datetime(sim_df["date_a"])
+    order = np.argsort(base | _seconds(dates), kind="stable")
+    base, known, dates = base[order], known[order], dates.iloc[order].reset_index(drop=True)
+
+    anchors = {}
+    cols = []
+    for period, months in specs:
+        if period not in anchors:
+            anchors[period] = _period_anchor(dates, period)
+        start, end = _spec_anchors(anchors[period], months, period)
+
+        col = f"{period}_{months}m_ret"
+        values = np.empty(len(order))
+        values[order] = (_compound(index, base, known, start, end) - 1) * 100
+        sim_df[col] = values
+        cols.append(col)
+
+    return sim_df.dropna(subset=cols) if dropna else sim_df
+
+def merge_return(sim_df, return_df, months, period):
+    """
+    Add the `period` ('past' or 'future') `months` window return to each feature row
+    and drop rows without returns in the window, with the `WINDOW_RETURN_ENGINE` implementation.
+    """
+    if WINDOW_RETURN_ENGINE == "merge":
+        return merge_return_reference(sim_df, return_df, months, period)
+    return merge_return_prefix(sim_df, return_df, months, period)
+
+def merge_returns(sim_df, return_df, specs=RETURN_HORIZONS):
+    """
+    Add every (period, months) window return in `specs` and drop rows missing any of them,
+    with the `WINDOW_RETURN_ENGINE` implementation.
+    """
+    if WINDOW_RETURN_ENGINE == "merge":
+        for period, months in specs:
+            sim_df = merge_return_reference(sim_df, return_df, months, period)
+        return sim_df
+    return add_window_returns(sim_df, return_df, specs)
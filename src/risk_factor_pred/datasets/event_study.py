@@ -0,0 +1,173 @@
+from risk_factor_pred.config import EVENT_WINDOWS, EVENT_MIN_COVERAGE
+from risk_factor_pred.datasets import build_panel as bp, storage as st
+from risk_factor_pred.wrds import crsp_returns as cr
+import pandas as pd
+import numpy as np
+
+"""
+Event-study features: cumulative abnormal returns (CARs) around filing dates.
+
+Days are counted on the trading calendar, i.e. the dates of the daily market
+return. Day 0 of a feature row is the first trading day on or after its `date_a`,
+and a window (start, end) covers trading days day0 + start ... day0 + end. The
+abnormal return is the market-adjusted return (stock return minus the market
+return of the same day) and the CAR is its sum over the window.
+
+Stock returns are keyed by (CIK, trading-day position) and prefix-summed once
+per daily partition (see `cr.pull_daily_returns()`), so each CAR costs two
+`searchsorted` lookups and only one partition of daily returns is in memory.
+"""
+
+def trading_calendar(market: pd.DataFrame):
+    """
+    Return (trading days as int64 day numbers, market return of each day), sorted by day.
+    """
+    market = market.dropna(subset=["date"]).sort_values("date")
+    days = pd.to_datetime(market["date"]).to_numpy(dtype="datetime64[D]").astype("int64")
+    days, first = np.unique(days, return_index=True)
+    return days, market["mkt"].to_numpy(dtype="float64")[first]
+
+def _day_numbers(dates) -> np.ndarray:
+    days = pd.to_datetime(pd.Series(dates), cache=False).to_numpy(dtype="datetime64[D]")
+    return np.where(np.isnat(days), np.iinfo("int64").min, days.astype("int64"))
+
+def event_days(calendar: np.ndarray, dates) -> np.ndarray:
+    """
+    Position in `calendar` of the first trading day on or after each date
+    (len(calendar) after the last trading day, -1 for missing dates).
+    """
+    days = _day_numbers(dates)
+    pos = np.searchsorted(calendar, days, side="left")
+    pos[days == np.iinfo("int64").min] = -1
+    return pos
+
+def build_abnormal_index(daily_df: pd.DataFrame, calendar: np.ndarray, mkt: np.ndarray) -> dict:
+    """
+    Sort daily returns by (cik, trading day) and build prefix sums of abnormal returns.
+
+    Returns the layout of `bp.build_return_index()` (sorted unique CIKs and keys,
+    with trading-day positions in place of dates) plus `cum_ar`. Days off the
+    calendar and missing stock or market returns are left out, so the number of
+    keys in a window is the number of days with an abnormal return.
+    """
+    uniq, codes = bp._cik_codes(daily_df["cik"])
+    days = _day_numbers(daily_df["date"])
+    pos = np.searchsorted(calendar, days, side="left")
+    on_calendar = pos < len(calendar)
+    on_calendar[on_calendar] = calendar[pos[on_calendar]] == days[on_calendar]
+
+    pos_in = np.minimum(pos, len(calendar) - 1)
+    ar = daily_df["ret"].to_numpy(dtype="float64") - mkt[pos_in]
+    keep = on_calendar & ~np.isnan(ar)
+
+    keys = (codes[keep].astype("int64") << bp._DATE_BITS) | pos[keep]
+    order = np.argsort(keys, kind="stable")
+    return {
+        "ciks": uniq,
+        "keys": keys[order],
+        "cum_ar": np.concatenate([[0.0], np.cumsum(ar[keep][order])]),
+    }
+
+def _car(index: dict, base, known, day0, start: int, end: int, n_days: int, min_coverage: float) -> np.ndarray:
+    """
+    CAR over trading days [day0 + start, day0 + end] for rows located with `bp._locate_ciks()`.
+    NaN if the window leaves the calendar or fewer than `min_coverage` of its days have a return.
+    """
+    first, last = day0 + start, day0 + end
+    inside = known & (day0 >= 0) & (first >= 0) & (last < n_days)
+    first, last = np.clip(first, 0, None), np.clip(last, 0, None)
+
+    lo = np.searchsorted(index["keys"], base | first, side="left")
+    hi = np.searchsorted(index["keys"], base | last, side="right")
+
+    car = index["cum_ar"][hi] - index["cum_ar"][lo]
+    car[~inside | (hi - lo < min_coverage * (end - start + 1))] = np.nan
+    return car
+
+def window_label(start: int, end: int) -> str:
+    """
+    (-1, 1) -> "car_m1_p1", (2, 60) -> "car_p2_p60".
+    """
+    day = lambda d: f"m{-d}" if d < 0 else f"p{d}"
+    return f"car_{day(start)}_{day(end)}"
+
+def event_returns(sim_df, windows=EVENT_WINDOWS, min_coverage: float = EVENT_MIN_COVERAGE, market=None, partitions=None) -> pd.DataFrame:
+    """
+    Return cik, date_a, event_date (day 0) and one `window_label()` column per
+    (start, end) window for each row of `sim_df`, in the same order.
+
+    Daily returns are read one partition at a time (`cr.daily_partitions()`, or
+    `partitions`: paths or DataFrames of cik, date, ret), and the market return
+    from `cr.load_market()` unless `market` (date, mkt) is given. Rows of CIKs
+    without daily returns get NaN.
+    """
+    if market is None:
+        market = cr.load_market()
+    if partitions is None:
+        partitions = cr.daily_partitions()
+    calendar, mkt = trading_calendar(market)
+
+    ciks = bp._normalize_cik(sim_df["cik"])
+    uniq, inverse = np.unique(ciks, return_inverse=True)
+    day0 = event_days(calendar, sim_df["date_a"])
+    cars = {window_label(start, end): np.full(len(sim_df), np.nan) for start, end in windows}
+
+    for part in partitions:
+        daily = part if isinstance(part, pd.DataFrame) else st.read_table(part, ["cik", "date", "ret"])
+        index = build_abnormal_index(daily, calendar, mkt)
+        rows = np.flatnonzero(np.isin(uniq, index["ciks"])[inverse])
+        if not len(rows):
+            continue
+
+        _, base, known = bp._locate_ciks(index, ciks[rows])
+        # visit events in (cik, day) order so the lookups walk the keys forward
+        order = np.argsort(base | np.clip(day0[rows], 0, None), kind="stable")
+        rows, base, known = rows[order], base[order], known[order]
+        for start, end in windows:
+            cars[window_label(start, end)][rows] = _car(index, base, known, day0[rows], start, end, len(calendar), min_coverage)
+
+    in_calendar = (day0 >= 0) & (day0 < len(calendar))
+    event_date = np.full(len(sim_df), np.datetime64("NaT"), dtype="datetime64[D]")
+    event_date[in_calendar] = calendar[day0[in_calendar]].astype("datetime64[D]")
+
+    out = pd.DataFrame({
+        "cik": ciks.astype(object),
+        "date_a": pd.to_datetime(pd.Series(sim_df["date_a"])).to_numpy(),
+        "event_date": event_date.astype("datetime64[ns]"),
+    })
+    for col, values in cars.items():
+        out[col] = values
+    return out
+
+def event_returns_reference(sim_df, daily_df, market, windows=EVENT_WINDOWS, min_coverage: float = EVENT_MIN_COVERAGE) -> pd.DataFrame:
+    """
+    Reference implementation of `event_returns()`: filters each CIK's daily returns
+    to each event window in turn. Slow; used to check the vectorized version.
+    """
+    calendar, mkt = trading_calendar(market)
+    cal_dates = calendar.astype("datetime64[D]")
+    market_by_day = pd.Series(mkt, index=pd.to_datetime(cal_dates))
+
+    daily_df = daily_df.copy()
+    daily_df["cik"] = bp._normalize_cik(daily_df["cik"])
+    daily_df["date"] = pd.to_datetime(daily_df["date"])
+    by_cik = {cik: g for cik, g in daily_df.groupby("cik")}
+
+    rows = []
+    for cik, date_a in zip(bp._normalize_cik(sim_df["cik"]), pd.to_datetime(pd.Series(sim_df["date_a"]))):
+        row = {"cik": cik, "date_a": date_a, "event_date": pd.NaT}
+        day0 = np.searchsorted(cal_dates, np.datetime64(date_a, "D")) if not pd.isna(date_a) else len(cal_dates)
+        if day0 < len(cal_dates):
+            row["event_date"] = pd.Timestamp(cal_dates[day0])
+        for start, end in windows:
+            car = np.nan
+            if day0 + start >= 0 and day0 + end < len(cal_dates) and cik in by_cik:
+                lo, hi = pd.Timestamp(cal_dates[day0 + start]), pd.Timestamp(cal_dates[day0 + end])
+                g = by_cik[cik]
+                g = g[(g["date"] >= lo) & (g["date"] <= hi)]
+                ar = (g["ret"] - g["date"].map(market_by_day)).dropna()
+                if len(ar) >= min_coverage * (end - start + 1):
+                    car = ar.sum()
+            row[window_label(start, end)] = car
+        rows.append(row)
+    return pd.DataFrame(rows)
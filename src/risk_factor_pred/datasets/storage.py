@@ -0,0 +1,168 @@
+from risk_factor_pred.config import FEATURES_FILE, FEATURES_STORE
+from typing import Iterable, Optional
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pyarrow as pa
+import pandas as pd
+import numpy as np
+import shutil
+import os
+
+"""
+Typed columnar storage for the features, the returns and the final panel.
+
+Tables are written as Parquet with an explicit schema: CIKs as int32, dates as
+date32, feature floats as float32 (returns stay float64 since they are compounded)
+and the other columns as listed in `COLUMN_TYPES`. Filing-level tables are
+partitioned by filing year (`year=YYYY` directories, the year of `date_a`), so a
+read can skip whole years and load only the columns it needs.
+"""
+
+COLUMN_TYPES = {
+    "cik": pa.int32(),
+    "date": pa.date32(),
+    "date_a": pa.date32(),
+    "date_b": pa.date32(),
+    "event_date": pa.date32(),
+    "distance": pa.int32(),
+    "distance_capped": pa.bool_(),
+    "levenshtein": pa.float32(),
+    "len_a": pa.int32(),
+    "len_b": pa.int32(),
+    "sentiment": pa.float32(),
+    "digest_a": pa.string(),
+    "digest_b": pa.string(),
+    "ret": pa.float64(),
+    "mkt": pa.float64(),
+}
+
+_PARTITIONING = ds.partitioning(pa.schema([("year", pa.int16())]), flavor="hive")
+
+def cik_to_int(values) -> np.ndarray:
+    """
+    CIKs given as int, float ("320193.0") or zero-padded strings -> int32, converting each distinct value once.
+    """
+    codes, uniques = pd.factorize(pd.Series(values))
+    ints = pd.to_numeric(pd.Series(uniques).astype(str).str.replace(r"\.0$", "", regex=True)).to_numpy("int32")
+    return ints[codes]
+
+def cik_to_str(values) -> np.ndarray:
+    """
+    CIKs -> 10-digit strings, converting each distinct value once.
+    """
+    codes, uniques = pd.factorize(pd.Series(values))
+    strs = pd.Series(uniques).astype(str).str.replace(r"\.0$", "", regex=True).str.zfill(10).to_numpy(object)
+    return strs[codes]
+
+def _dates(values) -> pd.Series:
+    values = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    try:
+        return pd.to_datetime(values, format="ISO8601")
+    except ValueError:
+        # older files mix day-first spellings in
+        return pd.to_datetime(values, format="mixed", dayfirst=True)
+
+def _column_type(name: str, values: pd.Series) -> pa.DataType:
+    if name in COLUMN_TYPES:
+        return COLUMN_TYPES[name]
+    if pd.api.types.is_bool_dtype(values):
+        return pa.bool_()
+    if pd.api.types.is_float_dtype(values):
+        return pa.float32()
+    if pd.api.types.is_integer_dtype(values):
+        return pa.int64()
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return pa.date32()
+    return pa.string()
+
+def to_table(df: pd.DataFrame) -> pa.Table:
+    """
+    Convert `df` to an Arrow table with the schema of `COLUMN_TYPES` (floats not listed become float32).
+    """
+    arrays, fields = [], []
+    for name in df.columns:
+        values = df[name]
+        kind = _column_type(name, values)
+        if name == "cik":
+            values = cik_to_int(values)
+        elif pa.types.is_date32(kind):
+            values = _dates(values).to_numpy(dtype="datetime64[D]")
+        arrays.append(pa.array(values, type=kind, from_pandas=True))
+        fields.append(pa.field(name, kind))
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+def write_table(df: pd.DataFrame, path, partition: bool = True) -> None:
+    """
+    Write `df` to `path`, replacing it atomically once written.
+
+    With `partition`, `path` is a directory of `year=YYYY` partitions (year of
+    `date_a`) and rows are sorted by (year, cik, date_a); otherwise `path` is a
+    single Parquet file and the row order is kept. An empty `df` is written as one
+    empty file with the schema, so it reads back as an empty table.
+    """
+    table = to_table(df)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".part")
+    shutil.rmtree(tmp, ignore_errors=True)
+
+    if partition and not len(table):
+        tmp.mkdir()
+        pq.write_table(table, tmp / "part-0.parquet")
+        shutil.rmtree(path, ignore_errors=True)
+    elif partition:
+        years = pa.array(_dates(df["date_a"]).dt.year.to_numpy(), type=pa.int16(), from_pandas=True)
+        table = table.append_column("year", years).sort_by([("year", "ascending"), ("cik", "ascending"), ("date_a", "ascending")])
+        ds.write_dataset(table, tmp, format="parquet", partitioning=_PARTITIONING,
+                         basename_template="part-{i}.parquet", existing_data_behavior="error", preserve_order=True)
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        pq.write_table(table, tmp)
+    os.replace(tmp, path)
+
+def _dataset(path) -> ds.Dataset:
+    return ds.dataset(path, format="parquet", partitioning=_PARTITIONING if path.is_dir() else None)
+
+def read_table(path, columns: Optional[Iterable[str]] = None, years: Optional[Iterable[int]] = None) -> pd.DataFrame:
+    """
+    Read a table written by `write_table()`: only `columns` if given, and only the
+    filing `years` if given (partitioned tables). Dates come back as datetime64[ns]
+    and strings as Arrow-backed `string[pyarrow]` columns.
+    """
+    dataset = _dataset(path)
+    if columns is None:
+        columns = table_columns(path)
+    row_filter = ds.field("year").isin(list(years)) if years is not None and path.is_dir() else None
+
+    table = dataset.to_table(columns=list(columns), filter=row_filter)
+    for i, field in enumerate(table.schema):
+        if pa.types.is_date32(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(pa.timestamp("ns")))
+    return table.to_pandas(types_mapper={pa.string(): pd.StringDtype("pyarrow")}.get)
+
+def table_columns(path) -> list:
+    """
+    Column names of a table written by `write_table()`, without reading it.
+    """
+    return [name for name in _dataset(path).schema.names if name != "year"]
+
+# --------------------------------------------------------------------------------------------------------------------
+#                                                FEATURES
+# --------------------------------------------------------------------------------------------------------------------
+
+def publish_features() -> None:
+    """
+    Write the rows of the step 04 checkpoint `FEATURES_FILE` to the typed `FEATURES_STORE`.
+    """
+    df = pd.read_csv(FEATURES_FILE, dtype={"cik": str, "digest_a": str, "digest_b": str})
+    write_table(df, FEATURES_STORE)
+
+def load_features(columns: Optional[Iterable[str]] = None, years: Optional[Iterable[int]] = None) -> pd.DataFrame:
+    """
+    Read `FEATURES_STORE` (see `read_table()`), first publishing `FEATURES_FILE` if the
+    store is missing or older than it. Without `FEATURES_FILE`, the store is read as it is.
+    """
+    if not FEATURES_STORE.exists() or (FEATURES_FILE.exists() and FEATURES_STORE.stat().st_mtime < FEATURES_FILE.stat().st_mtime):
+        publish_features()
+    return read_table(FEATURES_STORE, columns, years)
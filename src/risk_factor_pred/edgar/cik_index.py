@@ -1,6 +1,14 @@
-from risk_factor_pred.config import CIK_LIST, RAW_CIKS_DIR
+from risk_factor_pred.config import CIK_LIST, RAW_CIKS_DIR, RAW_MASTER_IDX_DIR, FORM, MAX_WORKERS
+from risk_factor_pred.edgar import downloader as sd
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from pathlib import Path
 import pandas as pd
 import requests
+import gzip
+import json
+import os
 
 def load_unique_ciks():
     """
@@ -31,68 +39,145 @@ def inputLetter():
         letter = input("Invalid... enter L or T...").lower()
     return letter
 
-def load_master_to_dataframe(year: int, qtr: int) -> pd.DataFrame:
+# --------------------------------------------------------------------------------------------------------------------
+#                                                MASTER.IDX CACHE
+# --------------------------------------------------------------------------------------------------------------------
+
+MASTER_COLUMNS = ["CIK", "Company Name", "Form Type", "Date Filed", "Filename"]
+
+# a cached quarter is final once it was fetched this long after the quarter ended
+_FINAL_AFTER = timedelta(days=2)
+
+def _quarter_bounds(year: int, qtr: int):
     """
-    Download master.idx for a given year/quarter and return it as a DataFrame
-    with columns: CIK, Company Name, Form Type.
+    Return (first day, first day of the next quarter) as UTC datetimes.
     """
-    url = f"https://www.sec.gov/Archives/edgar/full-index/{year}/QTR{qtr}/master.idx"
-    
-    HEADERS = {
-    "User-Agent": "Name name@domain.com",
-    "Accept-Encoding": "gzip, deflate",
-    "Connection": "keep-alive",
-    }
+    start = datetime(year, 3 * qtr - 2, 1, tzinfo=timezone.utc)
+    end = datetime(year + (qtr == 4), 3 * qtr + 1 if qtr < 4 else 1, 1, tzinfo=timezone.utc)
+    return start, end
 
-    r = requests.get(url, headers=HEADERS, timeout=30)
-    r.raise_for_status()
-    text = r.text
+def master_idx_path(year: int, qtr: int) -> Path:
+    """
+    Return the cache path of a quarter's gzipped master index.
+    """
+    return RAW_MASTER_IDX_DIR / f"{year}-QTR{qtr}.idx.gz"
+
+def fetch_master_idx(year: int, qtr: int) -> Optional[Path]:
+    """
+    Return the cached master.idx (gzipped) of a quarter, downloading it if needed.
 
-    lines = text.splitlines()
-    records = []
+    Quarters whose cached copy was fetched (or revalidated) two days or more after
+    they closed are final and never requested again. Otherwise (e.g. the current
+    quarter) a conditional GET with the ETag / Last-Modified of the cached copy
+    only transfers the file if it changed.
+    Returns None for quarters that have not started or are not published.
+    """
+    start, end = _quarter_bounds(year, qtr)
+    now = datetime.now(timezone.utc)
+    if start > now:
+        return None
 
-    for line in lines:
-        if "|" not in line:
-            continue
+    path = master_idx_path(year, qtr)
+    meta_path = path.with_name(f"{year}-QTR{qtr}.json")
+    if path.is_file():
+        fetched = datetime.fromtimestamp(path.stat().st_mtime, timezone.utc)
+        if fetched >= end + _FINAL_AFTER:
+            return path
+
+    headers = {}
+    if path.is_file() and meta_path.is_file():
+        meta = json.loads(meta_path.read_text())
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    url = f"{sd.SEC_WWW}/Archives/edgar/full-index/{year}/QTR{qtr}/master.gz"
+    try:
+        resp = sd.sec_get(url, headers=headers)
+    except requests.HTTPError as e:
+        if e.response is not None and e.response.status_code in (403, 404):
+            return None
+        raise
+
+    if resp.status_code == 304:
+        # unchanged: only record when we last checked
+        os.utime(path)
+        return path
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".part")
+    tmp.write_bytes(resp.content)
+    os.replace(tmp, path)
+    meta_path.write_text(json.dumps({
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+    }))
+    return path
+
+def parse_master_idx(path, form: str = FORM) -> pd.DataFrame:
+    """
+    Parse a gzipped master.idx and keep the `form` rows.
 
-        parts = line.split("|")
-        if len(parts) != 5:
-            continue
+    Only lines containing "|<form>|" are located (with str.find over the whole
+    text) and split, instead of splitting every line of the quarter. Returns the
+    columns CIK, Company Name, Form Type, Date Filed, Filename (all strings);
+    malformed lines (not 5 fields) are skipped.
+    """
+    text = gzip.decompress(Path(path).read_bytes()).decode("latin-1")
+    key = f"|{form}|"
+    rows = []
+    i = text.find(key, text.find("\n-----") + 1)
+    while i != -1:
+        start = text.rfind("\n", 0, i) + 1
+        end = text.find("\n", i)
+        if end == -1:
+            end = len(text)
+        parts = text[start:end].rstrip("\r").split("|")
+        if len(parts) == 5 and parts[2] == form:
+            rows.append(parts)
+        i = text.find(key, end)
+    return pd.DataFrame(rows, columns=MASTER_COLUMNS)
 
-        cik, name, form_type = parts[:3]
+def load_master_to_dataframe(year: int, qtr: int) -> pd.DataFrame:
+    """
+    Return master.idx for a given year/quarter (from the local cache when possible) as a DataFrame
+    with columns: CIK, Company Name, Form Type, Date Filed, Filename.
+    """
+    path = fetch_master_idx(year, qtr)
+    if path is None:
+        return pd.DataFrame(columns=MASTER_COLUMNS)
+    return parse_master_idx(path)
 
-        if form_type != "10-K":
-            continue
+def load_master_range(start_year: int, end_year: int) -> pd.DataFrame:
+    """
+    Fetch (in parallel) and parse every quarter of [start_year, end_year) into one DataFrame.
 
-        records.append(
-            {
-                "CIK": cik,
-                "Company Name": name,
-                "Form Type": form_type,
-            }
-        )
-    return pd.DataFrame(records)
+    All requests share the downloader's rate limiter; cached final quarters need no network.
+    """
+    quarters = [(year, qtr) for year in range(start_year, end_year) for qtr in range(1, 5)]
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        frames = list(executor.map(lambda q: load_master_to_dataframe(*q), quarters))
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame(columns=MASTER_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
 
 def cik_list_builder(start_year, end_year):
     """
     Build and save a master list of unique 10-K CIKs over a range of years.
 
     For each year in [start_year, end_year) and each quarter (1-4), the function
-    downloads the SEC `master.idx` index, filters for 10-K filings, concatenates
-    all results, removes duplicate CIKs, and writes the final list to
-    `RAW_CIKS_DIR / "cik_list.csv"`.
-    """
-    cik_df = []
-    for year in range(start_year, end_year):
-        for qtr in range(1, 5):
-            print(f"Downloading {year}, QTR {qtr}")
-            cik_df.append(load_master_to_dataframe(year, qtr))
-            
-    cik_df = pd.concat(cik_df, ignore_index=True)
+    loads the SEC `master.idx` index (cached under `RAW_MASTER_IDX_DIR`), filters
+    for 10-K filings, concatenates all results, removes duplicate CIKs, and writes
+    the final list to `RAW_CIKS_DIR / "cik_list.csv"`.
+    """
+    print(f"Loading master.idx for {start_year}-{end_year - 1}")
+    cik_df = load_master_range(start_year, end_year)
     cik_df.sort_values("CIK", inplace = True)
 
     # Keep only the first row of each consecutive block of equal CIKs
     mask = cik_df["CIK"].astype(str).shift() != cik_df["CIK"].astype(str)
 
     CIK_LIST = RAW_CIKS_DIR / "cik_list.csv"
-    cik_df[mask].to_csv(CIK_LIST, index=False)
\ No newline at end of file
+    cik_df.loc[mask, ["CIK", "Company Name", "Form Type"]].to_csv(CIK_LIST, index=False)
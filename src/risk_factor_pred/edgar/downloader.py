@@ -1,6 +1,11 @@
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from risk_factor_pred.config import FORM, START_DATE, MAX_WORKERS, RAW_DIR
+from risk_factor_pred.config import FORM, START_DATE, MAX_WORKERS, RAW_DIR, RAW_EDGAR_DIR, SEC_USER_AGENT, SEC_REQUESTS_PER_SECOND, DOWNLOAD_RETRIES
+from requests.adapters import HTTPAdapter
+import threading
+import requests
+import random
 import time
+import os
 from sec_edgar_downloader import Downloader
 
 def download_for_cik(cik: str):
@@ -58,5 +63,241 @@ def download(ciks):
     return
 
 
+# --------------------------------------------------------------------------------------------------------------------
+#                                                POOLED DOWNLOADER
+# --------------------------------------------------------------------------------------------------------------------
 
+SEC_WWW = "https://www.sec.gov"
+SEC_DATA = "https://data.sec.gov"
 
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by all download threads.
+
+    `acquire()` blocks until a token is available. Tokens refill at `rate` per second
+    up to `capacity`; with the default capacity of 1, requests are spaced at least
+    1/rate apart, so no one-second window ever holds more than `rate` requests.
+    `pause()` holds back every thread, e.g. after the server answered 429.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._resume = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._resume:
+                    wait = self._resume - now
+                else:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                    self._last = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._resume = max(self._resume, time.monotonic() + seconds)
+            self._tokens = 0
+
+_BUCKET = TokenBucket(SEC_REQUESTS_PER_SECOND)
+_LOCAL = threading.local()
+
+def _session() -> requests.Session:
+    """
+    Return this thread's keep-alive session (connections are reused across requests).
+    """
+    session = getattr(_LOCAL, "session", None)
+    if session is None:
+        session = requests.Session()
+        session.headers.update({"User-Agent": SEC_USER_AGENT, "Accept-Encoding": "gzip, deflate"})
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=4)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _LOCAL.session = session
+    return session
+
+def _backoff(attempt: int, retry_after=None) -> float:
+    """
+    Seconds to wait before retry `attempt` (0-based): the server's Retry-After if given,
+    else exponential backoff with jitter, capped at 60 s.
+    """
+    if retry_after is not None:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return min(60.0, 0.5 * 2 ** attempt) * random.uniform(1.0, 1.5)
+
+def _sec_request(url: str, read, stream: bool = False, headers=None):
+    """
+    GET a SEC URL through the shared rate limiter and return `read(response)`.
+
+    The single retry loop of the downloader: retries up to `DOWNLOAD_RETRIES` times
+    on 429/5xx responses and on connection errors, including a connection dropped
+    while `read` consumes the body, then raises (`requests.HTTPError` for HTTP
+    errors such as 404).
+    """
+    for attempt in range(DOWNLOAD_RETRIES + 1):
+        _BUCKET.acquire()
+        try:
+            resp = _session().get(url, stream=stream, headers=headers, timeout=30)
+            if resp.status_code not in _RETRY_STATUS or attempt == DOWNLOAD_RETRIES:
+                resp.raise_for_status()
+                return read(resp)
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+            if attempt == DOWNLOAD_RETRIES:
+                raise
+            time.sleep(_backoff(attempt))
+            continue
+
+        delay = _backoff(attempt, resp.headers.get("Retry-After"))
+        resp.close()
+        if resp.status_code == 429:
+            # throttling applies to the whole client, not just this thread
+            _BUCKET.pause(delay)
+        else:
+            time.sleep(delay)
+
+def sec_get(url: str, stream: bool = False, headers=None) -> requests.Response:
+    """
+    GET a SEC URL through the shared rate limiter (`headers` are added to the session's),
+    with the retries of `_sec_request()`.
+    """
+    return _sec_request(url, lambda resp: resp, stream, headers)
+
+def list_filings(cik: str) -> list:
+    """
+    Return the accession numbers of a CIK's `FORM` filings (no amendments) filed on or after `START_DATE`.
+    """
+    data = sec_get(f"{SEC_DATA}/submissions/CIK{cik}.json").json()
+    pages = [data["filings"]["recent"]]
+    for extra in data["filings"].get("files", []):
+        if extra.get("filingTo", "9999-12-31") < START_DATE:
+            continue
+        pages.append(sec_get(f"{SEC_DATA}/submissions/{extra['name']}").json())
+
+    accessions = []
+    for page in pages:
+        for acc, form, filed in zip(page["accessionNumber"], page["form"], page["filingDate"]):
+            if form == FORM and filed >= START_DATE:
+                accessions.append(acc)
+    return accessions
+
+def filing_path(cik: str, accession: str):
+    """
+    Return where a filing is saved: RAW_EDGAR_DIR/<cik>/<FORM>/<accession>/full-submission.txt.
+    """
+    return RAW_EDGAR_DIR / cik / FORM / accession / "full-submission.txt"
+
+def fetch_filing(cik: str, accession: str) -> int:
+    """
+    Stream one full submission to `filing_path()` and return its size in bytes (0 if already on disk).
+
+    The body is written in chunks to a `.part` file that replaces the target only
+    once complete, so an interrupted download never leaves a truncated filing.
+    """
+    dst = filing_path(cik, accession)
+    if dst.exists():
+        return 0
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_suffix(".part")
+    url = f"{SEC_WWW}/Archives/edgar/data/{int(cik)}/{accession.replace('-', '')}/{accession}.txt"
+
+    def write_body(resp) -> int:
+        size = 0
+        with resp, open(tmp, "wb") as f:
+            for chunk in resp.iter_content(chunk_size=1 << 16):
+                f.write(chunk)
+                size += len(chunk)
+        return size
+
+    # a connection dropped mid-body restarts the download within the retries of the request
+    size = _sec_request(url, write_body, stream=True)
+    os.replace(tmp, dst)
+    return size
+
+def fetch_filings(jobs) -> tuple:
+    """
+    Fetch (cik, accession) pairs in a thread pool and print progress.
+
+    Returns (number of filings written, bytes written, list of (cik, accession, error)).
+    """
+    jobs = list(jobs)
+    total = len(jobs)
+    written = nbytes = 0
+    errors = []
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {executor.submit(fetch_filing, cik, acc): (cik, acc) for cik, acc in jobs}
+        for idx, future in enumerate(as_completed(futures), start=1):
+            cik, acc = futures[future]
+            try:
+                size = future.result()
+            except Exception as e:
+                errors.append((cik, acc, f"{type(e).__name__}: {e}"))
+                print(f"[{idx}/{total}] {acc}: error")
+                continue
+            written += size > 0
+            nbytes += size
+            if idx % 100 == 0 or idx == total:
+                print(f"[{idx}/{total}] filings fetched")
+    return written, nbytes, errors
+
+def download_pooled(ciks):
+    """
+    Download `FORM` filings for a collection of CIKs with pooled connections.
+
+    Lists each CIK's filings from the submissions API, then streams every filing not
+    yet on disk into the `RAW_EDGAR_DIR` layout of `download()`. All requests share
+    one token bucket (`SEC_REQUESTS_PER_SECOND`), so the thread count only sets
+    how many requests can be in flight, not the request rate.
+    """
+    ciks = [str(c).strip().zfill(10) for c in ciks]
+    print(f"Found {len(ciks)} unique CIKs")
+
+    jobs = []
+    not_found = []
+    errors = []
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {executor.submit(list_filings, cik): cik for cik in ciks}
+        for future in as_completed(futures):
+            cik = futures[future]
+            try:
+                accessions = future.result()
+            except requests.HTTPError as e:
+                if e.response is not None and e.response.status_code == 404:
+                    not_found.append(cik)
+                else:
+                    errors.append((cik, str(e)))
+                continue
+            except Exception as e:
+                errors.append((cik, f"{type(e).__name__}: {e}"))
+                continue
+            jobs.extend((cik, acc) for acc in accessions if not filing_path(cik, acc).exists())
+
+    print(f"{len(jobs)} filings to download")
+    written, nbytes, fetch_errors = fetch_filings(jobs)
+    print(f"Downloaded {written} filings ({nbytes / 1e6:.1f} MB)")
+
+    if not_found:
+        print("\nCIKs not found:")
+        for cik in not_found:
+            print(" ", cik)
+
+    if errors or fetch_errors:
+        print("\nCIKs/filings with errors:")
+        for cik, err in errors:
+            print(f" {cik}: {err}")
+        for cik, acc, err in fetch_errors:
+            print(f" {cik} {acc}: {err}")
+    return
@@ -0,0 +1,156 @@
+from risk_factor_pred.config import RAW_EDGAR_DIR, INTERIM_CLEANED_DIR, FILINGS_INDEX
+from typing import Iterable, Optional
+from pathlib import Path
+import pandas as pd
+import sqlite3
+
+"""
+SQLite index of downloaded filings, built once from their SEC headers.
+
+One row per accession with its CIK, form type, filed date, period of report and
+the sizes of the raw and cleaned `full-submission.txt`. Rows are written by the
+parent process (after cleaning, or by `backfill()`), never by pool workers, which
+only read the index to look up filing dates.
+"""
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS filings (
+    accession    TEXT PRIMARY KEY,
+    cik          TEXT NOT NULL,
+    form         TEXT,
+    filed        TEXT,
+    period       TEXT,
+    raw_size     INTEGER,
+    cleaned_size INTEGER
+);
+CREATE INDEX IF NOT EXISTS filings_cik ON filings (cik);
+"""
+
+_HEADER_FIELDS = {
+    "ACCESSION NUMBER": "accession",
+    "CONFORMED SUBMISSION TYPE": "form",
+    "FILED AS OF DATE": "filed",
+    "CONFORMED PERIOD OF REPORT": "period",
+}
+
+def _iso(date: Optional[str]) -> Optional[str]:
+    """
+    "20100315" -> "2010-03-15"; anything else -> None.
+    """
+    if date and len(date) == 8 and date.isdigit():
+        return f"{date[:4]}-{date[4:6]}-{date[6:]}"
+    return None
+
+def parse_header(path) -> dict:
+    """
+    Read the SEC header of a full-submission.txt (stops at the first <DOCUMENT>).
+
+    Returns {"accession", "form", "filed", "period"} (missing fields are absent).
+    The filed date comes from the "<SEC-DOCUMENT>... : yyyymmdd" line, the same
+    line `check_date()` reads, with FILED AS OF DATE as fallback.
+    """
+    meta = {}
+    document_date = None
+    with open(path, "rb") as f:
+        for raw in f:
+            line = raw.decode("utf-8", errors="replace").strip()
+            if line.startswith(("<DOCUMENT>", "</SEC-HEADER>")):
+                break
+            if line.startswith("<SEC-DOCUMENT>"):
+                document_date = line.partition(":")[2].strip()
+                continue
+            key, sep, value = line.partition(":")
+            field = _HEADER_FIELDS.get(key.strip())
+            if sep and field and field not in meta:
+                meta[field] = value.strip()
+
+    meta["filed"] = _iso(document_date) or _iso(meta.get("filed"))
+    meta["period"] = _iso(meta.get("period"))
+    return meta
+
+def connect() -> sqlite3.Connection:
+    """
+    Open (and create if needed) the filing index.
+    """
+    FILINGS_INDEX.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(FILINGS_INDEX, timeout=30)
+    conn.executescript(_SCHEMA)
+    return conn
+
+def _file_size(path) -> Optional[int]:
+    return path.stat().st_size if path.is_file() else None
+
+def record_filings(acc_dirs: Iterable[Path]) -> int:
+    """
+    Parse the headers of raw accession folders (`RAW_EDGAR_DIR/<cik>/10-K/<accession>`)
+    and insert or refresh their rows. Returns the number of filings recorded.
+    """
+    rows = []
+    for acc_dir in acc_dirs:
+        acc_dir = Path(acc_dir)
+        raw_file = acc_dir / "full-submission.txt"
+        if not raw_file.is_file():
+            continue
+        cik = acc_dir.parent.parent.name
+        meta = parse_header(raw_file)
+        cleaned_file = INTERIM_CLEANED_DIR / cik / "10-K" / acc_dir.name / "full-submission.txt"
+        rows.append((
+            acc_dir.name, cik, meta.get("form"), meta["filed"], meta["period"],
+            _file_size(raw_file), _file_size(cleaned_file),
+        ))
+
+    conn = connect()
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO filings VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.close()
+    return len(rows)
+
+def backfill(ciks: Optional[Iterable[str]] = None) -> int:
+    """
+    Record every raw filing that is missing from the index or whose raw file changed size.
+
+    If `ciks` is None, scans all CIK folders under `RAW_EDGAR_DIR`. Returns the number
+    of filings recorded.
+    """
+    if ciks is None:
+        ciks = [p.name for p in RAW_EDGAR_DIR.iterdir() if p.is_dir()] if RAW_EDGAR_DIR.is_dir() else []
+
+    conn = connect()
+    known = dict(conn.execute("SELECT accession, raw_size FROM filings"))
+    conn.close()
+
+    todo = []
+    for cik in ciks:
+        folders_path = RAW_EDGAR_DIR / cik / "10-K"
+        if not folders_path.is_dir():
+            continue
+        for acc_dir in folders_path.iterdir():
+            if known.get(acc_dir.name, -1) != _file_size(acc_dir / "full-submission.txt"):
+                todo.append(acc_dir)
+    return record_filings(todo) if todo else 0
+
+def filing_dates(cik: str) -> dict:
+    """
+    Return {accession: "yyyy-mm-dd"} for the indexed filings of a CIK ({} without an index).
+    """
+    if not FILINGS_INDEX.is_file():
+        return {}
+    conn = sqlite3.connect(f"file:{FILINGS_INDEX}?mode=ro", uri=True, timeout=30)
+    try:
+        rows = conn.execute("SELECT accession, filed FROM filings WHERE cik = ? AND filed IS NOT NULL", (cik,))
+        return dict(rows)
+    finally:
+        conn.close()
+
+def load_filings():
+    """
+    Return the whole index as a DataFrame (empty, with the index columns, if there is none).
+    """
+    columns = ["accession", "cik", "form", "filed", "period", "raw_size", "cleaned_size"]
+    if not FILINGS_INDEX.is_file():
+        return pd.DataFrame(columns=columns)
+    conn = sqlite3.connect(f"file:{FILINGS_INDEX}?mode=ro", uri=True)
+    try:
+        return pd.read_sql_query("SELECT * FROM filings", conn)
+    finally:
+        conn.close()
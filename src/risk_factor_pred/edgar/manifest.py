@@ -0,0 +1,83 @@
+from risk_factor_pred.config import FORM, START_DATE, RAW_EDGAR_DIR, DOWNLOAD_MANIFEST
+from risk_factor_pred.edgar import cik_index as cl, downloader as sd
+from typing import Iterable, Optional
+import pandas as pd
+import os
+
+"""
+Incremental download manifest.
+
+Compares the `FORM` accessions listed in the quarterly `master.idx` files with the
+filings already under `RAW_EDGAR_DIR` and fetches only the missing ones, without
+asking the submissions API about every CIK. The missing accessions of each run
+are saved to `DOWNLOAD_MANIFEST`; since the manifest is recomputed from disk,
+filings that failed are simply picked up again by the next run.
+"""
+
+def _accession(filename: str) -> str:
+    """
+    "edgar/data/320193/0000320193-20-000096.txt" -> "0000320193-20-000096"
+    """
+    return filename.rsplit("/", 1)[-1][:-len(".txt")]
+
+def indexed_filings(start_year: int, end_year: int, ciks: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """
+    Return the `FORM` filings listed in master.idx for years [start_year, end_year),
+    filed on or after `START_DATE`, as a DataFrame with columns cik (10 digits), accession, filed.
+
+    Quarters that are not published yet are skipped (see `cl.fetch_master_idx()`).
+    If `ciks` is given, only their filings are kept.
+    """
+    df = cl.load_master_range(start_year, end_year)
+    df = df[(df["Form Type"] == FORM) & (df["Date Filed"] >= START_DATE)]
+    df = pd.DataFrame({
+        "cik": df["CIK"].astype(str).str.strip().str.zfill(10),
+        "accession": df["Filename"].map(_accession),
+        "filed": df["Date Filed"],
+    })
+    if ciks is not None:
+        df = df[df["cik"].isin({str(c).strip().zfill(10) for c in ciks})]
+    return df.drop_duplicates("accession").reset_index(drop=True)
+
+def on_disk() -> set:
+    """
+    Return {(cik, accession)} for every raw filing under `RAW_EDGAR_DIR` (CIKs zero-padded to 10 digits).
+    """
+    have = set()
+    if not RAW_EDGAR_DIR.is_dir():
+        return have
+    for cik_entry in os.scandir(RAW_EDGAR_DIR):
+        form_dir = os.path.join(cik_entry.path, FORM)
+        if not os.path.isdir(form_dir):
+            continue
+        cik = cik_entry.name.zfill(10)
+        for acc_entry in os.scandir(form_dir):
+            if os.path.isfile(os.path.join(acc_entry.path, "full-submission.txt")):
+                have.add((cik, acc_entry.name))
+    return have
+
+def build_manifest(start_year: int, end_year: int, ciks: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """
+    Compute the accessions listed in master.idx but missing on disk and save them to `DOWNLOAD_MANIFEST`.
+    """
+    expected = indexed_filings(start_year, end_year, ciks)
+    have = on_disk()
+    missing = expected[[(c, a) not in have for c, a in zip(expected["cik"], expected["accession"])]]
+
+    DOWNLOAD_MANIFEST.parent.mkdir(parents=True, exist_ok=True)
+    missing.to_csv(DOWNLOAD_MANIFEST, index=False)
+    print(f"{len(expected)} {FORM} filings indexed, {len(expected) - len(missing)} on disk, {len(missing)} missing")
+    return missing
+
+def download_missing(start_year: int, end_year: int, ciks: Optional[Iterable[str]] = None) -> None:
+    """
+    Build the manifest and fetch only the missing accessions (see `sd.fetch_filings()`).
+    """
+    missing = build_manifest(start_year, end_year, ciks)
+    written, nbytes, errors = sd.fetch_filings(zip(missing["cik"], missing["accession"]))
+    print(f"Downloaded {written} filings ({nbytes / 1e6:.1f} MB)")
+
+    if errors:
+        print(f"\nFilings with errors (still listed in {DOWNLOAD_MANIFEST.name}):")
+        for cik, acc, err in errors:
+            print(f" {cik} {acc}: {err}")
@@ -1,14 +1,13 @@
-from risk_factor_pred.config import ensure_project_dirs, RAW_EDGAR_DIR, INTERIM_CLEANED_DIR, FEATURES_FIELDS, FEATURES_FILE, INTERIM_ITEM1A_DIR, FINAL_DATASET, RETURNS_FILE, CIK_LIST
-from risk_factor_pred.edgar import cik_index as cl, downloader as sd
-from risk_factor_pred.text import clean as hc, segment as si, tokenize as sm
+from risk_factor_pred.config import ensure_project_dirs, RAW_EDGAR_DIR, INTERIM_CLEANED_DIR, FEATURES_FILE, FEATURES_FAILURES_FILE, INTERIM_ITEM1A_DIR, FINAL_DATASET, CIK_LIST, FUSED_KEEP_CLEANED, DOWNLOADER, RETURN_HORIZONS, EVENT_RETURNS_FILE
+from risk_factor_pred.edgar import cik_index as cl, downloader as sd, filing_index as fi, manifest as mf
+from risk_factor_pred.text import clean as hc, segment as si, tokenize as sm, feature_store as fs, fused as fu
 from risk_factor_pred.wrds import crsp_returns as cr
-from risk_factor_pred.datasets import build_panel as bp
+from risk_factor_pred.datasets import build_panel as bp, event_study as es, storage as st
 from risk_factor_pred.models import rf_setup as rs, rf_classification as rc, rf_regression as rr
 from typing import Iterable, List, Optional
 from pathlib import Path
 import pandas as pd
 import argparse
-import csv
 
 def _digits_only(x: str) -> str:
     return "".join(ch for ch in x if ch.isdigit())
@@ -67,6 +66,14 @@ def _parse_args():
     p.add_argument("--from-step", type=int, default=0, choices=range(0, 8))
     p.add_argument("--to-step", type=int, default=7, choices=range(0, 8))
 
+    p.add_argument("--manifest", action="store_true", help="In step 1, fetch only the master.idx accessions (start/end year) missing on disk")
+    p.add_argument("--refresh-returns", action="store_true", help="In step 5, pull only CRSP months newer than the cached returns")
+    p.add_argument("--event-returns", action="store_true", help="Also pull daily CRSP returns in step 5 and write CARs around filing dates in step 6")
+    p.add_argument("--force", action="store_true", help="Recompute all text features instead of only new/changed pairs")
+    p.add_argument("--items", type=str, default=None, help="Comma-separated items to extract in step 3. Example: 1A,7,7A")
+    p.add_argument("--fused", action="store_true", help="Run steps 2 and 3 as one in-memory pass per CIK (also warms the token cache)")
+    p.add_argument("--keep-cleaned", action="store_true", help="With --fused, also write the full cleaned filings")
+
     return p.parse_args()
 
 def step_00_build_universe(start_year: int = 2006 , end_year: int = 2026) -> None:
@@ -90,7 +97,20 @@ def step_01_download_filings(ciks: Optional[Iterable[str]] = None):
     """
     if ciks is None:
         ciks = cl.load_unique_ciks()
-    sd.download(ciks)
+    if DOWNLOADER == "pooled":
+        sd.download_pooled(ciks)
+    else:
+        sd.download(ciks)
+
+def step_01_download_missing(ciks: Optional[Iterable[str]] = None, start_year: int = 2006, end_year: int = 2026) -> None:
+    """
+    Download only the filings listed in master.idx for [start_year, end_year) that are not on disk yet.
+
+    If `ciks` is None, uses the full universe from `cik_list.csv`.
+    """
+    if ciks is None:
+        ciks = cl.load_unique_ciks()
+    mf.download_missing(start_year, end_year, ciks)
 
 def step_02_clean_filings(ciks: Optional[Iterable[str]] = None) -> None:
     """
@@ -111,43 +131,105 @@ def step_03_extract_item1a(ciks: Optional[Iterable[str]] = None) -> None:
     ciks_dirs = _resolve_cik_dirs(INTERIM_CLEANED_DIR, ciks)
     si.try_exercize(ciks_dirs)
 
-def step_04_compute_features(ciks: Optional[Iterable[str]] = None) -> None:
+def step_03_extract_items(ciks: Optional[Iterable[str]] = None, items: Iterable[str] = ("1A",)) -> None:
+    """
+    Extract several sections (e.g. Items 1A, 7 and 7A) from cleaned filings in one pass per filing.
+
+    Each section is written to its own directory (`si.item_dir()`), laid out like
+    `INTERIM_ITEM1A_DIR`. If `ciks` is None, processes all CIK folders found in the cleaned directory.
+    """
+    ciks_dirs = _resolve_cik_dirs(INTERIM_CLEANED_DIR, ciks)
+    si.extract_items_worker(ciks_dirs, tuple(items))
+
+def step_02_03_clean_and_extract(ciks: Optional[Iterable[str]] = None, keep_cleaned: bool = FUSED_KEEP_CLEANED) -> None:
+    """
+    Fused steps 02 and 03: clean each raw filing, extract Item 1A and cache its tokens in memory.
+
+    Avoids writing and re-reading the full cleaned filings (written only with
+    `keep_cleaned`). If `ciks` is None, processes all CIK folders found in the raw directory.
+    """
+    ciks_dirs = _resolve_cik_dirs(RAW_EDGAR_DIR, ciks)
+    fu.fused_worker(ciks_dirs, keep_cleaned)
+
+def step_04_compute_features(ciks: Optional[Iterable[str]] = None, force: bool = False) -> None:
     """
     Compute levenshtein/sentiment features from extracted Item 1A text.
 
-    Writes row-level results into `FEATURES_FILE`.
+    Streams row-level results to `FEATURES_FILE` as pairs complete and logs failures
+    to `FEATURES_FAILURES_FILE`. Pairs already in the file whose `item1A.txt`
+    contents are unchanged (same hashes) are skipped, so an interrupted run resumes
+    where it stopped; with `force` the file is rebuilt from scratch. The compacted
+    rows are then published to the typed `FEATURES_STORE` read by later steps.
     """
     ciks_dirs = _resolve_cik_dirs(INTERIM_ITEM1A_DIR, ciks)
 
-    with open(FEATURES_FILE, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=FEATURES_FIELDS)
-        writer.writeheader()
-        sm.concurrency_runner(writer, ciks_dirs)
+    # filing dates are looked up in the filing index; add filings cleaned before it existed
+    fi.backfill(ciks_dirs)
+
+    done = {}
+    for row in fs.prepare_append(FEATURES_FILE, force):
+        done.setdefault(row["cik"], set()).add(fs.done_key(row))
+
+    with fs.FeatureSink(FEATURES_FILE, FEATURES_FAILURES_FILE) as sink:
+        planned = sm.concurrency_runner(sink, ciks_dirs, done)
+
+    # recomputed pairs replace the rows of their previous content; pairs no longer planned are dropped
+    fs.compact_features(FEATURES_FILE, planned)
+    st.publish_features()
     
 def step_05_pull_returns() -> None:
     """
     Pull monthly return data from WRDS/CRSP for the CIK universe.
 
-    Saves the combined return panel to `RETURNS_FILE`.
+    Saves the combined return panel to the typed Parquet `RETURNS_CACHE`.
     """
     return_df = cr.df_with_returns()
-    return_df.to_csv(RETURNS_FILE, index=False)
     old_ciks_df = pd.read_csv(CIK_LIST)
     old_ciks_df[old_ciks_df['CIK']==return_df['CIK']]
     print(old_ciks_df)
 
+def step_05_refresh_returns() -> None:
+    """
+    Update the return panel with only the CRSP months after each CIK's last cached month.
+
+    CIKs whose CCM links changed are re-pulled in full. Saves the merged panel to
+    `RETURNS_CACHE`.
+    """
+    cr.refresh_returns()
+
+def step_05_pull_daily_returns() -> None:
+    """
+    Pull daily CRSP returns and the daily market return for the CIK universe.
+
+    Writes one Parquet partition per batch of CIKs to `RETURNS_DAILY_DIR` and the
+    market return (the trading calendar) to `MARKET_DAILY_FILE`.
+    """
+    cr.pull_daily_returns()
+
 def step_06_build_panel() -> None:
     """
     Merge text features with returns to create the final modeling dataset.
 
-    Produces `FINAL_DATASET` with past/future window returns added.
+    Produces `FINAL_DATASET` (typed Parquet, partitioned by filing year) with the
+    past/future window returns of `RETURN_HORIZONS` added.
     """
-    sim_df, return_df = bp.datatype_setup(pd.read_csv(FEATURES_FILE), pd.read_csv(RETURNS_FILE))
+    sim_df, return_df = bp.datatype_setup(st.load_features(), cr.load_returns())
     print(sim_df)
-    sim_df = bp.merge_return(sim_df, return_df, months=18, period="future")
-    sim_df = bp.merge_return(sim_df, return_df, months=12, period="past")
+    sim_df = bp.merge_returns(sim_df, return_df, RETURN_HORIZONS)
     
-    sim_df.to_csv(FINAL_DATASET, index=False)
+    st.write_table(sim_df, FINAL_DATASET)
+
+def step_06_event_returns() -> None:
+    """
+    Compute cumulative abnormal returns over `EVENT_WINDOWS` around each feature row's filing date.
+
+    Saved to `EVENT_RETURNS_FILE` (one row per feature row), apart from
+    `FINAL_DATASET` so that missing CARs do not drop rows from the models.
+    """
+    sim_df = st.load_features(["cik", "date_a", "date_b"])
+    event_df = es.event_returns(sim_df)
+    event_df["date_b"] = sim_df["date_b"]
+    st.write_table(event_df, EVENT_RETURNS_FILE)
 
 def step_07_run_models() -> None:
     """
@@ -155,7 +237,8 @@ def step_07_run_models() -> None:
 
     Trains the Random Forest models and prints evaluation output.
     """
-    df = pd.read_csv(FINAL_DATASET)
+    # the content hashes only matter to step 04
+    df = st.read_table(FINAL_DATASET, [c for c in st.table_columns(FINAL_DATASET) if not c.startswith("digest_")])
 
     df = rs.feature_engineering(df)
 
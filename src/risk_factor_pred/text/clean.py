@@ -1,5 +1,10 @@
-from risk_factor_pred.config import RAW_EDGAR_DIR, INTERIM_CLEANED_DIR, MAX_WORKERS
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from risk_factor_pred.config import FORM, RAW_EDGAR_DIR, INTERIM_CLEANED_DIR, MAX_WORKERS, CLEAN_EXECUTOR, CLEAN_BATCH_SIZE, CLEAN_MAX_TASKS_PER_CHILD, CLEANER
+from risk_factor_pred.text import segment as si
+from risk_factor_pred.edgar import filing_index as fi
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from pathlib import Path
+import traceback
+import sys
 import re
 
 # --------------------------------------------------------------------------------------------------------------------
@@ -340,18 +345,176 @@ def clean_html(file_content):
     cleaned = clean_lines(cleaned)
     return cleaned
 
-def print_clean_txt(html_path):
+# --------------------------------------------------------------------------------------------------------------------
+#                                              FUSED HTML CLEANER
+# --------------------------------------------------------------------------------------------------------------------
+
+# Each pattern below merges consecutive steps of clean_html() whose matches cannot
+# interact, so the main document is rewritten ~12 times (always with a constant
+# replacement, no Python callbacks) instead of ~40. <head> and style= stay separate:
+# removing them can join whitespace onto a following " id=", which the greedy \s+ of
+# the id/align pattern then swallows too.
+_FUSED_HEAD_RE = re.compile(r'<head>.*?</head>', re.DOTALL | re.IGNORECASE)
+_FUSED_STYLE_RE = re.compile(r'\sstyle=(["\']).*?\1', re.IGNORECASE)
+_FUSED_ATTR_RE = re.compile(r'\s+(?:id|align)=(["\']).*?\1', re.IGNORECASE)
+_FUSED_COMMENT_IMG_RE = re.compile(r'<(?:!--(?s:.*?)--|(?i:img).*?)>')
+_FUSED_ENTITY_3_RE = re.compile(r'&#\d{3};')
+_FUSED_NL_TAGS_RE = re.compile(
+    r'<(?:ix:[a-zA-Z0-9_:]+.*?|(?s:(?:html|font|a|table|tr|td).*?)|B|center)>', re.IGNORECASE
+)
+_FUSED_DROP_TAGS_RE = re.compile(
+    r'<(?:/ix:[a-zA-Z0-9_:]+|/(?:html|font|B|center|a|table|tr|td)|(?s:[bh]r.*?))>', re.IGNORECASE
+)
+_FUSED_XBRLI_RE = re.compile(r'<xbrli:([a-zA-Z0-9_:]+).*?>.*?</xbrli:\1>', re.DOTALL | re.IGNORECASE)
+_FUSED_EMPTY_P_RE = re.compile(r'<p>\s*</p>', re.DOTALL | re.IGNORECASE)
+_FUSED_EMPTY_DIV_RE = re.compile(r'<div>\s*</div>', re.IGNORECASE)
+_FUSED_P_TAG_RE = re.compile(r'<p.*?>', re.IGNORECASE)
+_FUSED_LEFTOVER_RE = re.compile(r'<.*?>|&#(?:\d{1,8}|[xX][0-9A-Fa-f]{1,8});')
+_FUSED_ITEM_HEAD_RE = re.compile(
+    r'items?\b\s*'
+    r'\d+[A-Za-z]?'
+    r'(?:\s*(?:and|to|through|-)\s*\d+[A-Za-z]?)*'
+    r'\s*\.', re.IGNORECASE)
+_FUSED_IGNORE_PRE_RE = re.compile(r'\b(?:in|of|see|at|with|under|this|to)[ \t"“”]*$', re.IGNORECASE)
+_FUSED_TRAILING_WS_RE = re.compile(r'[ \t]+\n')
+
+def _fused_break_on_item_heads(text):
+    r"""
+    `break_on_item_heads()` without the leading \s* in the pattern, which made the
+    regex engine start a match attempt at every character. Matches are anchored
+    on "item" and extended back over the whitespace run before them instead.
+    """
+    out = []
+    last = 0
+    prev_end = 0
+    for m in _FUSED_ITEM_HEAD_RE.finditer(text):
+        item_start = m.start()
+        start = item_start
+        while start > prev_end and text[start - 1].isspace():
+            start -= 1
+        prev_end = m.end()
+
+        if start > 0 and text[start-1] != '\n':
+            lead = len(text[start:item_start]) - len(text[start:item_start].lstrip(" \t"))
+            ctx = text[max(0, start + lead - 40):start + lead]
+            if _FUSED_IGNORE_PRE_RE.search(ctx):
+                continue
+
+            out.append(text[last:start])
+            out.append('\n')
+            last = start
+    out.append(text[last:])
+    return _FUSED_TRAILING_WS_RE.sub('\n', ''.join(out))
+
+def clean_html_fused(file_content):
     """
-    Load a filing, clean it, and return the cleaned text.
+    Same output as `clean_html()` with far fewer full-text copies.
+
+    The filing is first cut to the <SEC-DOCUMENT> ... <SEQUENCE>2 range with plain
+    string searches, so exhibits and encoded graphics are never unwrapped or
+    scanned; the remaining steps use the merged, precompiled _FUSED_* patterns.
     """
-    try:
-        with open(html_path, 'r', encoding='utf-8') as file:
-            file_content = file.read()
-        cleaned = clean_html(file_content)
-    except FileNotFoundError:
-        print(f"Error: The file '{html_path}' was not found.")
+    start = file_content.find("<SEC-DOCUMENT>")
+    if start != -1:
+        file_content = file_content[start:]
+    end = file_content.find("<SEQUENCE>2")
+    if end != -1:
+        file_content = file_content[:end]
+
+    cleaned = soft_unwrap_html_lines(file_content)
+    del file_content
+    cleaned = _FUSED_HEAD_RE.sub('', cleaned)
+    cleaned = _FUSED_STYLE_RE.sub('', cleaned)
+    cleaned = _FUSED_ATTR_RE.sub('', cleaned)
+
+    cleaned = _FUSED_COMMENT_IMG_RE.sub('', cleaned)
+    cleaned = cleaned.replace('<span>', '').replace('</span>', '').replace('&#8217;', "'").replace('&#8220;', '"').replace('&#8221;', '"')
+    cleaned = cleaned.replace('&nbsp;', ' ').replace('&#146;', "'")
+    cleaned = _FUSED_ENTITY_3_RE.sub(' ', cleaned)
+
+    cleaned = _FUSED_NL_TAGS_RE.sub('\n', cleaned)
+    cleaned = _FUSED_DROP_TAGS_RE.sub('', cleaned)
+    cleaned = _FUSED_XBRLI_RE.sub('', cleaned)
+
+    while True:
+        before = len(cleaned)
+        cleaned = _FUSED_EMPTY_P_RE.sub('', cleaned)
+        cleaned = _FUSED_EMPTY_DIV_RE.sub('', cleaned)
+        if len(cleaned) == before:
+            break
+
+    # prepend_newline_to_p + strip_all_html_tags: the <p ...> tag itself goes anyway
+    cleaned = _FUSED_P_TAG_RE.sub('\n', cleaned)
+    cleaned = _FUSED_LEFTOVER_RE.sub('', cleaned)
+    cleaned = _fused_break_on_item_heads(cleaned)
+    cleaned = clean_lines(cleaned)
     return cleaned
 
+_CLEANERS = {
+    "fused": clean_html_fused,
+    "reference": clean_html,
+}
+
+# --------------------------------------------------------------------------------------------------------------------
+#                                              STREAMING FILING READER
+# --------------------------------------------------------------------------------------------------------------------
+
+def _skip_document(f):
+    """
+    Advance a binary file object past the </DOCUMENT> line of the current block.
+    """
+    for line in f:
+        if line.startswith(b"</DOCUMENT>"):
+            return
+
+def read_main_document(path, form=FORM):
+    """
+    Stream a full-submission.txt and return its SEC header and main document as text.
+
+    The submission is a sequence of <DOCUMENT> blocks (the 10-K, then exhibits,
+    uuencoded GRAPHIC/ZIP/PDF payloads, XBRL files). Only the header and the first
+    block whose <TYPE> starts with `form` are kept; every other block is skipped
+    line by line without being held in memory, and reading stops after the main
+    document. If no block has that type, the first block is used.
+    """
+    form = form.encode()
+    kept = []
+    fallback = None
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.startswith(b"<DOCUMENT>"):
+                kept.append(line)                   # SEC header (and anything outside documents)
+                continue
+
+            type_line = f.readline()
+            doc_type = type_line[len(b"<TYPE>"):].strip() if type_line.startswith(b"<TYPE>") else b""
+            if doc_type.startswith(form) or fallback is None:
+                block = [line, type_line]
+                for line in f:
+                    block.append(line)
+                    if line.startswith(b"</DOCUMENT>"):
+                        break
+                if doc_type.startswith(form):
+                    fallback = None
+                    kept.extend(block)
+                    break
+                fallback = block
+            else:
+                _skip_document(f)
+    if fallback is not None:
+        kept.extend(fallback)
+
+    text = b"".join(kept).decode("utf-8")
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+def print_clean_txt(html_path):
+    """
+    Load the main document of a filing, clean it, and return the cleaned text.
+    Errors (e.g. a missing file) are raised to the caller, which reports them per filing.
+    """
+    file_content = read_main_document(html_path)
+    return _CLEANERS[CLEANER](file_content)
+
 
 # --------------------------------------------------------------------------------------------------------------------
 #                                                Cleaning 'Items'
@@ -481,22 +644,102 @@ def print_10X(SAVE_path, html_content):
     with open(SAVE_path, "w", encoding='utf-8') as new_file:
         new_file.write(html_content)
 
-
-def clean_worker(ciks):
+def recycling_pool(max_workers: int = MAX_WORKERS) -> ProcessPoolExecutor:
     """
-    Run the filing cleaning step in parallel across a list of CIKs.
+    Process pool whose workers are replaced after `CLEAN_MAX_TASKS_PER_CHILD` tasks
+    to cap memory growth (Python 3.11+; older versions keep their workers).
+    """
+    recycle = {"max_tasks_per_child": CLEAN_MAX_TASKS_PER_CHILD} if sys.version_info >= (3, 11) else {}
+    return ProcessPoolExecutor(max_workers=max_workers, **recycle)
 
-    Uses a thread pool to call `cleaner()` on each CIK.
+def clean_worker(ciks, executor: str = CLEAN_EXECUTOR):
     """
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = {executor.submit(cleaner, cik): cik for cik in ciks}
+    Run the filing cleaning step in parallel across a list of CIKs.
 
+    With `executor="process"` (default), filings from all CIKs are split into
+    batches of `CLEAN_BATCH_SIZE` and cleaned in a process pool, so the
+    regex-heavy work is not serialized by the GIL; each worker process is
+    replaced after `CLEAN_MAX_TASKS_PER_CHILD` batches to cap memory growth.
+    Failures are reported per filing. `executor="thread"` keeps the old
+    one-thread-per-CIK behaviour.
+    """
+    if executor == "thread":
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+            futures = {pool.submit(cleaner, cik): cik for cik in ciks}
+
+            for fut in as_completed(futures):
+                cik = futures[fut]
+                try:
+                    fut.result()
+                except Exception as e:
+                    print(f"[FAILED] {cik}: {type(e).__name__} - {e}")
+        fi.backfill(ciks)
+        return
+
+    jobs = [job for cik in ciks for job in filing_jobs(cik)]
+    batches = [jobs[i:i + CLEAN_BATCH_SIZE] for i in range(0, len(jobs), CLEAN_BATCH_SIZE)]
+    print(f"Cleaning {len(jobs)} filings in {len(batches)} batches")
+
+    failed = []
+    with recycling_pool() as pool:
+        futures = [pool.submit(clean_batch, batch) for batch in batches]
         for fut in as_completed(futures):
-            cik = futures[fut]
-            try:
-                fut.result()
-            except Exception as e:
-                print(f"[FAILED] {cik}: {type(e).__name__} - {e}")
+            for src, error in fut.result():
+                if error is not None:
+                    failed.append(src)
+                    print(f"[FAILED] {src}\n{error}")
+
+    failed_set = set(failed)
+    fi.record_filings(Path(src).parent for src, _ in jobs if str(src) not in failed_set)
+
+    print(f"Cleaned {len(jobs) - len(failed)}/{len(jobs)} filings")
+    if failed:
+        print("\nFilings that failed:")
+        for src in failed:
+            print(" ", src)
+
+def filing_jobs(cik):
+    """
+    List the (source, destination) paths of every raw 10-K filing of a CIK.
+    """
+    output_filename = "full-submission.txt"
+    folders_path = RAW_EDGAR_DIR / cik / "10-K"
+    dst_root = INTERIM_CLEANED_DIR / cik / "10-K"
+    if not folders_path.is_dir():
+        print(f"[FAILED] {cik}: no raw filings in {folders_path}")
+        return []
+    return [
+        (acc_dir / output_filename, dst_root / acc_dir.name / output_filename)
+        for acc_dir in folders_path.iterdir()
+    ]
+
+def clean_filing(src_file, dst_file):
+    """
+    Clean one raw filing and write the cleaned text to `dst_file`.
+    """
+    html_content = cleaning_items(print_clean_txt(src_file))
+    dst_file.parent.mkdir(parents=True, exist_ok=True)
+    print(f"save path: {dst_file}")
+    print_10X(dst_file, html_content)
+    try:
+        si.save_item_index(dst_file, si.build_item_index(html_content))
+    except Exception:
+        # step 03 retries from the file and reports filings it cannot segment
+        print(f"[FAILED] item index of {src_file}\n{traceback.format_exc()}")
+
+def clean_batch(batch):
+    """
+    Clean a batch of (source, destination) filings in one worker process.
+    Returns a list of (source, traceback or None), one per filing.
+    """
+    results = []
+    for src_file, dst_file in batch:
+        try:
+            clean_filing(src_file, dst_file)
+            results.append((str(src_file), None))
+        except Exception:
+            results.append((str(src_file), traceback.format_exc()))
+    return results
 
 def cleaner(cik):
     """
@@ -506,20 +749,8 @@ def cleaner(cik):
     and writes outputs to the corresponding path under `INTERIM_CLEANED_DIR`.
     """
     try:
-        output_filename = "full-submission.txt"
-        folders_path = RAW_EDGAR_DIR / cik / "10-K"
-        dst_root = INTERIM_CLEANED_DIR / cik / "10-K"
-        for acc_dir in folders_path.iterdir():
-            src_file = acc_dir / output_filename
-            html_content = cleaning_items(print_clean_txt(src_file))
-
-            dst_dir = dst_root / acc_dir.name
-            dst_dir.mkdir(parents=True, exist_ok=True)
-
-            dst_file = dst_dir / output_filename
-            print(f"save path: {dst_file}")
-
-            print_10X(dst_file, html_content)
+        for src_file, dst_file in filing_jobs(cik):
+            clean_filing(src_file, dst_file)
     except:
         print(f"Cleaning Failed on {cik}")
     return
@@ -0,0 +1,142 @@
+from risk_factor_pred.config import FEATURES_FIELDS
+from datetime import datetime, timezone
+import traceback
+import json
+import csv
+import os
+
+"""
+Read and incrementally update the features CSV written by step 04.
+
+Every row carries the content hashes of the two `item1A.txt` files it was computed
+from (`digest_a`, `digest_b`), so a rerun can tell which pairs are still up to date.
+The features file therefore doubles as the checkpoint of an interrupted run.
+"""
+
+def pair_key(row) -> tuple:
+    """
+    Identify a comparison pair: (cik, date_a, date_b).
+    """
+    return (str(row["cik"]), str(row["date_a"]), str(row["date_b"]))
+
+def done_key(row) -> tuple:
+    """
+    Identify a comparison pair together with the content it was computed from.
+    """
+    return pair_key(row) + (row["digest_a"], row["digest_b"])
+
+def read_features(path):
+    """
+    Return the complete rows of a features CSV as a list of dicts (values are strings).
+
+    Returns None if the file is missing or was written with another column layout.
+    Rows cut short by an interrupted run are skipped.
+    """
+    if not path.exists():
+        return None
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        if reader.fieldnames != FEATURES_FIELDS:
+            return None
+        return [
+            row for row in reader
+            if None not in row and None not in row.values() and len(row["digest_b"]) == 64
+        ]
+
+def write_features(path, rows) -> None:
+    """
+    Atomically replace `path` with a features CSV holding `rows`.
+    """
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=FEATURES_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp, path)
+
+def prepare_append(path, force: bool = False) -> list:
+    """
+    Make `path` ready for appending rows and return the rows it already holds.
+
+    Starts a fresh file (header only) if `force` is set, or if the file is missing
+    or has another layout; otherwise drops a half-written last line.
+    """
+    rows = None if force else read_features(path)
+    if rows is None:
+        write_features(path, [])
+        return []
+
+    with open(path, "r+b") as f:
+        data = f.read()
+        if not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+    return rows
+
+def compact_features(path, planned=None) -> None:
+    """
+    Rewrite `path` keeping only the newest row of every comparison pair.
+
+    `planned` maps each CIK processed in this run to its current comparison plan,
+    {pair_key: (digest_a, digest_b)} (see `tokenize.plan_cik()`). The rows of these
+    CIKs are rebuilt from the plan: pairs that are no longer compared (e.g. a filing
+    was removed) and rows computed from other contents are dropped. Rows of CIKs
+    not in `planned` are kept as they are.
+    """
+    planned = planned or {}
+    rows = read_features(path) or []
+    latest = {}
+    for row in rows:
+        key = pair_key(row)
+        plan = planned.get(key[0])
+        if plan is not None and plan.get(key) != (row["digest_a"], row["digest_b"]):
+            continue
+        latest[key] = row
+    write_features(path, list(latest.values()))
+
+class FeatureSink:
+    """
+    Stream feature rows to the features CSV as pairs complete.
+
+    Every row is flushed right away and fsynced every `fsync_every` rows, so an
+    interrupted run loses at most the rows still in flight. Failed tasks are
+    appended to `failures_path` as JSON lines with their traceback.
+    Use as a context manager; call `prepare_append()` on the features file first.
+    """
+
+    def __init__(self, path, failures_path, fsync_every: int = 50):
+        self.path = path
+        self.failures_path = failures_path
+        self.fsync_every = fsync_every
+        self.written = 0
+        self.failed = 0
+
+    def __enter__(self):
+        self._file = open(self.path, "a", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._file, fieldnames=FEATURES_FIELDS)
+        return self
+
+    def __exit__(self, *exc):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        return False
+
+    def write(self, row) -> None:
+        self._writer.writerow(row)
+        self._file.flush()
+        self.written += 1
+        if self.written % self.fsync_every == 0:
+            os.fsync(self._file.fileno())
+
+    def fail(self, task: dict, exc: BaseException) -> None:
+        """
+        Record a failed task (e.g. {"cik": ..., "filing1": ..., "filing2": ...}) and its traceback.
+        """
+        self.failed += 1
+        record = dict(task)
+        record["time"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        record["error"] = f"{type(exc).__name__}: {exc}"
+        record["traceback"] = "".join(traceback.format_exception(exc))
+        with open(self.failures_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+        print(f"[FAILED] {task}: {record['error']}")
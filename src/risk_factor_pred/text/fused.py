@@ -0,0 +1,81 @@
+from risk_factor_pred.config import RAW_EDGAR_DIR, INTERIM_CLEANED_DIR, FUSED_KEEP_CLEANED
+from risk_factor_pred.text import clean as hc, segment as si, tokenize as sm
+from risk_factor_pred.edgar import filing_index as fi
+from concurrent.futures import as_completed
+import traceback
+
+"""
+Fused steps 02 + 03 (+ token cache warm-up of step 04) for one CIK at a time.
+
+Each raw filing is cleaned, segmented and tokenized in memory inside one worker:
+only `item1A.txt` and its cached token IDs are written, and the full cleaned
+filing (with its item offset index) only if `keep_cleaned` is set. Work is split
+per CIK because a CIK's token cache must only be written by one process at a time.
+"""
+
+def process_filing(cik, acc_dir, keep_cleaned: bool = FUSED_KEEP_CLEANED) -> bool:
+    """
+    Clean one raw filing, save its Item 1A section and cache its tokens.
+    Returns False if no Item 1A heading was found.
+    """
+    text = hc.cleaning_items(hc.print_clean_txt(acc_dir / "full-submission.txt"))
+    if keep_cleaned:
+        dst_file = INTERIM_CLEANED_DIR / cik / "10-K" / acc_dir.name / "full-submission.txt"
+        dst_file.parent.mkdir(parents=True, exist_ok=True)
+        hc.print_10X(dst_file, text)
+        index = si.build_item_index(text)
+        si.save_item_index(dst_file, index)
+        chunk = si.item_text(text, index, "1A")
+    else:
+        chunk = si.item1a_text(text)
+    if chunk is None:
+        return False
+
+    si.save_item1a(cik, acc_dir.name, chunk)
+    sm.cache_tokens(cik, chunk.encode("utf-8"))
+    return True
+
+def process_cik(cik, keep_cleaned: bool = FUSED_KEEP_CLEANED):
+    """
+    Run every raw 10-K filing of a CIK through `process_filing()`.
+    Returns a list of (source, found Item 1A, traceback or None), one per filing.
+    """
+    folders_path = RAW_EDGAR_DIR / cik / "10-K"
+    if not folders_path.is_dir():
+        return [(str(folders_path), False, f"no raw filings in {folders_path}\n")]
+
+    results = []
+    for acc_dir in folders_path.iterdir():
+        try:
+            found = process_filing(cik, acc_dir, keep_cleaned)
+            results.append((str(acc_dir), found, None))
+        except Exception:
+            results.append((str(acc_dir), False, traceback.format_exc()))
+    return results
+
+def fused_worker(ciks, keep_cleaned: bool = FUSED_KEEP_CLEANED) -> None:
+    """
+    Run `process_cik()` for a list of CIKs in a process pool and report failures per filing.
+    """
+    total = found = 0
+    done = []
+    failed = []
+    with hc.recycling_pool() as pool:
+        futures = [pool.submit(process_cik, cik, keep_cleaned) for cik in ciks]
+        for fut in as_completed(futures):
+            for src, has_item1a, error in fut.result():
+                total += 1
+                found += has_item1a
+                if error is not None:
+                    failed.append(src)
+                    print(f"[FAILED] {src}\n{error}")
+                else:
+                    done.append(src)
+
+    fi.record_filings(done)
+
+    print(f"Processed {total - len(failed)}/{total} filings, Item 1A found in {found}")
+    if failed:
+        print("\nFilings that failed:")
+        for src in failed:
+            print(" ", src)
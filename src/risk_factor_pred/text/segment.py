@@ -1,6 +1,10 @@
 from concurrent.futures import ProcessPoolExecutor
-from risk_factor_pred.config import INTERIM_CLEANED_DIR, MAX_WORKERS, INTERIM_ITEM1A_DIR
-from itertools import islice
+from risk_factor_pred.config import INTERIM_DIR, INTERIM_CLEANED_DIR, MAX_WORKERS, INTERIM_ITEM1A_DIR
+from itertools import islice, accumulate
+from bisect import bisect_right
+import json
+import mmap
+import os
 import re
 
 def _normalize_ws(s: str) -> str:
@@ -29,12 +33,16 @@ def item_dict_builder(path):
       - item_line: 1-indexed line number where the heading appears
     Consecutive duplicate item tokens are removed (deduped) to reduce noise.
     """
+    return item_dict_from_lines(path.read_text(encoding="utf-8", errors="ignore").splitlines())
 
-    text = path.read_text(encoding="utf-8", errors="ignore")
-    out = []
-    HEAD_RE = re.compile(r'^\s*(?P<kind>items?)\b\s*(?P<rest>[0-9].*)$', re.IGNORECASE)                                # Regex to find lines to split
+HEAD_RE = re.compile(r'^\s*(?P<kind>items?)\b\s*(?P<rest>[0-9].*)$', re.IGNORECASE)                                # Regex to find lines to split
 
-    for i, raw in enumerate(text.splitlines(), start=1):
+def item_dict_from_lines(lines):
+    """
+    Same as `item_dict_builder()` for the lines of a cleaned filing already in memory.
+    """
+    out = []
+    for i, raw in enumerate(lines, start=1):
         line = _normalize_ws(raw)
         if not line:
             continue
@@ -74,8 +82,7 @@ def number_of_rounds(item_dict, bool):
     listAllItems = [int(i) for i in out]
 
     # sometimes "Item 400" exists
-    while max(listAllItems) > 20:
-        listAllItems.remove(max(listAllItems))
+    listAllItems = [i for i in listAllItems if i <= 20]
     
     max_num = max(listAllItems)
 
@@ -96,7 +103,12 @@ def table_content_builder(filepath):
     Returns: list[str]
     eg ['1', '1A', '1B', '1C', '2', ...]
     """
-    item_dict = item_dict_builder(filepath)
+    return table_content_from_items(item_dict_builder(filepath))
+
+def table_content_from_items(item_dict):
+    """
+    Same as `table_content_builder()` from an already built `item_dict`.
+    """
     listAllItems = number_of_rounds(item_dict, bool=False)
     tableContent = ["1", "1A", "1B", "1C", "1D", "2", "3", "4", "5", "6", "7", "7A", "8"]
     letters_tuple = ("","A","B","C")
@@ -118,19 +130,42 @@ def item_segmentation_list(filepath):
 
     Returns list[dict]: The selected sequence (list of dicts with 'Item number' and 'Item line').
     """
-    tableContent = table_content_builder(filepath)
-    item_dict = item_dict_builder(filepath)
+    with open(filepath, "r", encoding="utf-8", errors="replace") as f:
+        lines = f.read().splitlines(keepends=True)
+    return select_segmentation(item_dict_from_lines(lines), _line_start_offsets(lines))
+
+def _line_start_offsets(lines):
+    """
+    Return the offset of every line start, plus the total length, for lines kept with their line ends.
+    """
+    return list(accumulate(map(len, lines), initial=0))
+
+def select_segmentation(item_dict, line_start_char):
+    """
+    The candidate selection of `item_segmentation_list()`, from an already built
+    `item_dict` and the character offsets of the line starts (`_line_start_offsets()`).
+    """
+    tableContent = table_content_from_items(item_dict)
+
+    # item_num -> its headings and their (ascending) line numbers, so the first heading
+    # after `last_ele` is a bisect instead of a scan of the whole item_dict
+    rows_by_num = {}
+    for r in item_dict:
+        rows_by_num.setdefault(r['item_num'], []).append(r)
+    lines_by_num = {num: [r['item_line'] for r in rows] for num, rows in rows_by_num.items()}
 
     list_lines = []
     last_ele = 0
     for _ in range(number_of_rounds(item_dict, bool=True)):
         lines = []
         for itemTC in tableContent:
-            for r in item_dict:
-                if itemTC == r.get('item_num') and r.get('item_line') > last_ele:
-                    lines.append(r)
-                    last_ele = r['item_line']
-                    break
+            rows = rows_by_num.get(itemTC)
+            if rows is None:
+                continue
+            k = bisect_right(lines_by_num[itemTC], last_ele)
+            if k < len(rows):
+                lines.append(rows[k])
+                last_ele = rows[k]['item_line']
         list_lines.append(lines)
 
     # ----- Choose candidate with greatest character span -----
@@ -138,15 +173,6 @@ def item_segmentation_list(filepath):
     if len(list_lines) == 1:
         return list_lines[0]
 
-    with open(filepath, "r", encoding="utf-8", errors="replace") as f:
-        text = f.read()
-
-    def _line_start_offsets(text: str):
-        starts = [0]
-        for line in text.splitlines(keepends=True):
-            starts.append(starts[-1] + len(line))
-        return starts
-
     def _normalize_line_index(item_line: int, num_lines: int) -> int:
         if item_line is None:
             return 0
@@ -154,8 +180,7 @@ def item_segmentation_list(filepath):
             return item_line - 1
         return max(0, min(item_line, num_lines - 1))
 
-    line_start_char = _line_start_offsets(text)
-    num_lines = len(text.splitlines())
+    num_lines = len(line_start_char) - 1
 
     best_i = 0
     best_span = float("-inf")
@@ -172,6 +197,227 @@ def item_segmentation_list(filepath):
     
     return list_lines[best_i]
 
+def item1a_text(text):
+    """
+    Return the Item 1A section of a cleaned filing (from its heading up to the next
+    item heading), or None if no Item 1A heading was found.
+    """
+    lines = text.splitlines(keepends=True)
+    item_dict = item_dict_from_lines(lines)
+    if not item_dict:
+        return None
+    item_segmentation = select_segmentation(item_dict, _line_start_offsets(lines))
+
+    # Find the position of item 1A in the list[dict]
+    idx_1a = next((i for i, d in enumerate(item_segmentation) if d.get("item_num") == "1A"), None)
+
+    if idx_1a is None:
+        return None
+
+    item1a_seg = item_segmentation[idx_1a : idx_1a + 2]
+    page_list = [i['item_line'] for i in item1a_seg]
+
+    return "".join(islice(lines, page_list[0] - 1, page_list[1]-1))
+
+# --------------------------------------------------------------------------------------------------------------------
+#                                                ITEM OFFSET INDEX
+# --------------------------------------------------------------------------------------------------------------------
+
+def build_item_index(text) -> dict:
+    """
+    Segment a cleaned filing in one pass and record the UTF-8 byte offset of every heading.
+
+    Returns {"items": [...], "segmentation": [...], "end": total bytes}, where both lists
+    hold {"item_num", "item_line", "offset"} dicts: "items" every detected heading
+    (`item_dict_from_lines()`), "segmentation" the selected sequence (`select_segmentation()`).
+    A filing without any heading gets an empty segmentation.
+    """
+    lines = text.splitlines(keepends=True)
+    item_dict = item_dict_from_lines(lines)
+    char_starts = _line_start_offsets(lines)
+    if text.isascii():
+        byte_starts = char_starts
+    else:
+        byte_starts = list(accumulate((len(line.encode("utf-8")) for line in lines), initial=0))
+
+    segmentation = select_segmentation(item_dict, char_starts) if item_dict else []
+
+    def _with_offset(r):
+        return {**r, "offset": byte_starts[r["item_line"] - 1]}
+
+    return {
+        "items": [_with_offset(r) for r in item_dict],
+        "segmentation": [_with_offset(r) for r in segmentation],
+        "end": byte_starts[-1],
+    }
+
+def item_index_path(filepath):
+    """
+    Return the sidecar index path of a cleaned filing: full-submission.txt -> full-submission.items.json.
+    """
+    return filepath.with_suffix(".items.json")
+
+def save_item_index(filepath, index: dict) -> None:
+    """
+    Store the item index of the cleaned filing at `filepath` next to it, stamped with the file's size and mtime.
+    """
+    st = filepath.stat()
+    record = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, **index}
+    path = item_index_path(filepath)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(record), encoding="utf-8")
+    os.replace(tmp, path)
+
+def load_item_index(filepath):
+    """
+    Return the saved item index of a cleaned filing, or None if it is missing or the file changed since.
+    """
+    path = item_index_path(filepath)
+    if not path.exists():
+        return None
+    index = json.loads(path.read_text(encoding="utf-8"))
+    st = filepath.stat()
+    if (index.get("size"), index.get("mtime_ns"), index.get("end")) != (st.st_size, st.st_mtime_ns, st.st_size):
+        return None
+    return index
+
+def item_span(index: dict, item_num: str = "1A"):
+    """
+    Return the (start, end) byte offsets of an item in the selected segmentation, or None if it is absent.
+    The item ends where the next selected heading starts.
+    """
+    segmentation = index["segmentation"]
+    idx = next((i for i, d in enumerate(segmentation) if d["item_num"] == item_num), None)
+    if idx is None:
+        return None
+    return segmentation[idx]["offset"], segmentation[idx + 1]["offset"]
+
+def read_item(filepath, index: dict, item_num: str = "1A"):
+    """
+    Read one item of a cleaned filing with a seek and a read, or return None if it is absent.
+    """
+    span = item_span(index, item_num)
+    if span is None:
+        return None
+    start, end = span
+    with open(filepath, "rb") as f:
+        f.seek(start)
+        return f.read(end - start).decode("utf-8", errors="replace")
+
+def item_text(text, index: dict, item_num: str = "1A"):
+    """
+    `read_item()` for a cleaned filing already in memory: slice `text` at the offsets of its `index`.
+    """
+    span = item_span(index, item_num)
+    if span is None:
+        return None
+    start, end = span
+    if text.isascii():
+        return text[start:end]
+    return text.encode("utf-8")[start:end].decode("utf-8", errors="replace")
+
+def filing_item_index(filepath) -> dict:
+    """
+    Return the item index of a cleaned filing, building and saving it from a single read if needed.
+    """
+    index = load_item_index(filepath)
+    if index is None:
+        # bytes -> str keeps line ends as on disk, so the offsets match the file
+        index = build_item_index(filepath.read_bytes().decode("utf-8", errors="replace"))
+        save_item_index(filepath, index)
+    return index
+
+def item_dir(item_num: str):
+    """
+    Return the output directory of a section: "1A" -> INTERIM_ITEM1A_DIR, "7" -> INTERIM_DIR / "item7", "7A" -> .../"item7a".
+    """
+    item_num = item_num.upper()
+    return INTERIM_ITEM1A_DIR if item_num == "1A" else INTERIM_DIR / f"item{item_num.lower()}"
+
+def save_item(cik, filing, item_num: str, chunk):
+    """
+    Write a section to `item_dir(item_num)/<cik>/10-K/<filing>/item<item_num>.txt` and return the path.
+    """
+    item_num = item_num.upper()
+    dst_path = item_dir(item_num) / cik / '10-K' / filing
+    dst_path.mkdir(parents=True, exist_ok=True)
+
+    dst_file = dst_path / f"item{item_num}.txt"
+
+    with open(dst_file, "w", encoding='utf-8') as f:
+        f.write(chunk)
+    return dst_file
+
+def save_item1a(cik, filing, chunk):
+    """
+    Write an Item 1A section to `INTERIM_ITEM1A_DIR/<cik>/10-K/<filing>/item1A.txt` and return the path.
+    """
+    return save_item(cik, filing, "1A", chunk)
+
+# --------------------------------------------------------------------------------------------------------------------
+#                                              MULTI-SECTION EXTRACTION
+# --------------------------------------------------------------------------------------------------------------------
+
+def extract_filing_items(filepath, items) -> dict:
+    """
+    Return {item_num: text} for the requested items of one cleaned filing.
+
+    The item index is loaded (or built from one read) once, and every section is
+    sliced out of a read-only memory map of the file. Items without a heading, or
+    whose heading is the last one detected (no end), are left out.
+    """
+    index = filing_item_index(filepath)
+    spans = {}
+    for item_num in items:
+        try:
+            span = item_span(index, item_num.upper())
+        except IndexError:
+            span = None
+        if span is not None:
+            spans[item_num.upper()] = span
+    if not spans:
+        return {}
+
+    with open(filepath, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return {num: mm[start:end].decode("utf-8", errors="replace") for num, (start, end) in spans.items()}
+
+def extract_items(cik, items=("1A",)) -> dict:
+    """
+    Extract the requested sections (e.g. ["1A", "7", "7A"]) of every cleaned 10-K filing of a CIK
+    in one pass per filing, writing each to its `item_dir()`.
+
+    Failures are reported per filing. Returns {item_num: number of filings written}.
+    """
+    written = dict.fromkeys((num.upper() for num in items), 0)
+    path = INTERIM_CLEANED_DIR / cik / '10-K'
+    if not path.is_dir():
+        print(f"[FAILED] {cik}: no cleaned filings in {path}")
+        return written
+
+    for filing in path.iterdir():
+        filepath = filing / "full-submission.txt"
+        try:
+            sections = extract_filing_items(filepath, items)
+        except Exception as e:
+            print(f"[FAILED] {filepath}: {type(e).__name__} - {e}")
+            continue
+        for item_num, chunk in sections.items():
+            save_item(cik, filing.name, item_num, chunk)
+            written[item_num] += 1
+    return written
+
+def extract_items_worker(ciks: list, items=("1A",)) -> None:
+    """
+    Runs extract_items in parallel and prints how many filings each section was found in.
+    """
+    totals = dict.fromkeys((num.upper() for num in items), 0)
+    with ProcessPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        for written in executor.map(extract_items, ciks, [items] * len(ciks)):
+            for item_num, n in written.items():
+                totals[item_num] += n
+    for item_num, n in totals.items():
+        print(f"Item {item_num}: {n} filings -> {item_dir(item_num)}")
+
 def print_items(cik):
     """
     Extract and save Item 1A text for all cleaned 10-K filings for a single CIK.
@@ -184,28 +430,12 @@ def print_items(cik):
         for filing in path.iterdir():
             p = path / filing
             filepath = p / "full-submission.txt"
-            item_segmentation = item_segmentation_list(filepath)
 
-            # Find the position of item 1A in the list[dict]
-            idx_1a = next((i for i, d in enumerate(item_segmentation) if d.get("item_num") == "1A"), None)
-            
-            if idx_1a is None:
+            chunk = read_item(filepath, filing_item_index(filepath), "1A")
+            if chunk is None:
                 continue
 
-            item1a_seg = item_segmentation[idx_1a : idx_1a + 2]
-            page_list = [i['item_line'] for i in item1a_seg]
-
-            with filepath.open("r", encoding="utf-8", errors="replace") as f:
-                lines = list(islice(f, page_list[0] - 1, page_list[1]-1))
-            chunk = "".join(lines)
-
-            dst_path = INTERIM_ITEM1A_DIR / cik / '10-K' / filing.name
-            dst_path.mkdir(parents=True, exist_ok=True)
-
-            dst_file = dst_path / "item1A.txt"
-
-            with open(dst_file, "w", encoding='utf-8') as f:
-                f.write(chunk)
+            save_item1a(cik, filing.name, chunk)
             print("okkkkk")
     except:
         print("failed")
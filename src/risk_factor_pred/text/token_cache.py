@@ -0,0 +1,119 @@
+from risk_factor_pred.config import INTERIM_TOKENS_DIR
+import numpy as np
+import hashlib
+import os
+
+"""
+On-disk cache of tokenized Item 1A sections.
+
+Layout under `INTERIM_TOKENS_DIR`:
+    <cik>/vocab.txt         one token per line, line number = token ID (append-only)
+    <cik>/<sha256>.npy      uint32 token-ID array of one item1A.txt, keyed by its content hash
+
+Comparisons are always between filings of the same CIK, so each CIK has its own
+vocabulary. A CIK's cache must only be written by one process at a time.
+"""
+
+_VOCABS = {}  # cik -> {"index": token -> id, "words": list[str], "size": bytes of vocab.txt loaded}
+
+def digest(data: bytes) -> str:
+    """
+    Return the hex SHA-256 of `data`, used as the cache key of a file's content.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+def file_digest(path) -> str:
+    """
+    Return the hex SHA-256 of the file at `path`.
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _vocab_path(cik):
+    return INTERIM_TOKENS_DIR / cik / "vocab.txt"
+
+def _ids_path(cik, key):
+    return INTERIM_TOKENS_DIR / cik / f"{key}.npy"
+
+def _load_vocab(cik) -> dict:
+    """
+    Return the in-process copy of a CIK's vocabulary, re-reading `vocab.txt` if it changed on disk.
+    """
+    path = _vocab_path(cik)
+    size = path.stat().st_size if path.exists() else 0
+    entry = _VOCABS.get(cik)
+    if entry is not None and entry["size"] == size:
+        return entry
+
+    words = []
+    if size:
+        data = path.read_bytes()
+        if not data.endswith(b"\n"):
+            # drop a line left half-written by an interrupted run
+            data = data[: data.rfind(b"\n") + 1]
+            with open(path, "r+b") as f:
+                f.truncate(len(data))
+            size = len(data)
+        words = data.decode("utf-8").splitlines()
+
+    entry = {"index": {w: i for i, w in enumerate(words)}, "words": words, "size": size}
+    _VOCABS[cik] = entry
+    return entry
+
+def vocab_index(cik) -> dict:
+    """
+    Return the token -> ID mapping of a CIK. New tokens added to it must be saved with `save_vocab()`.
+    """
+    return _load_vocab(cik)["index"]
+
+def vocab_words(cik) -> list:
+    """
+    Return the ID -> token list of a CIK.
+    """
+    entry = _load_vocab(cik)
+    index, words = entry["index"], entry["words"]
+    if len(words) < len(index):
+        words.extend(list(index)[len(words):])
+    return words
+
+def save_vocab(cik, index: dict, start: int) -> None:
+    """
+    Append the tokens of `index` with ID >= `start` to the CIK's `vocab.txt`.
+    """
+    new_words = list(index)[start:]
+    if not new_words:
+        return
+    path = _vocab_path(cik)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "ab") as f:
+        f.write(("\n".join(new_words) + "\n").encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+
+    entry = _VOCABS[cik]
+    entry["words"].extend(new_words)
+    entry["size"] = path.stat().st_size
+
+def load_ids(cik, key):
+    """
+    Return the cached token-ID array (memory-mapped, read-only) for a content hash, or None.
+    """
+    path = _ids_path(cik, key)
+    if not path.exists():
+        return None
+    return np.load(path, mmap_mode="r")
+
+def save_ids(cik, key, ids) -> np.ndarray:
+    """
+    Store a token-ID sequence as a uint32 `.npy` file and return the array.
+    """
+    arr = np.asarray(ids, dtype=np.uint32)
+    path = _ids_path(cik, key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp.npy")
+    np.save(tmp, arr)
+    os.replace(tmp, path)
+    return arr
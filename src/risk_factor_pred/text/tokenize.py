@@ -1,8 +1,14 @@
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from nltk.sentiment import SentimentIntensityAnalyzer
-from risk_factor_pred.config import INTERIM_ITEM1A_DIR, MAX_WORKERS, INTERIM_CLEANED_DIR
+from typing import NamedTuple
+from risk_factor_pred.text import token_cache as tc
+from risk_factor_pred.edgar import filing_index as fi
+from risk_factor_pred.config import INTERIM_ITEM1A_DIR, MAX_WORKERS, INTERIM_CLEANED_DIR, RAW_EDGAR_DIR, LEVENSHTEIN_ENGINE, LEVENSHTEIN_MAX_DISTANCE
+import numpy as np
+import threading
+import string
+import signal
 import nltk
-import sys
 import re
 
 nltk.download("vader_lexicon", quiet=True)
@@ -62,12 +68,24 @@ def make_comps(cik):
     date_data = []
     folders_path = INTERIM_ITEM1A_DIR / cik / "10-K"
     checkdate_path = INTERIM_CLEANED_DIR / cik / "10-K"
+    raw_path = RAW_EDGAR_DIR / cik / "10-K"
+    indexed = fi.filing_dates(cik)
     
     for i in folders_path.iterdir():
         if not (i / "item1A.txt").is_file():
             continue
 
-        date_data.append(check_date(checkdate_path / i.name) if (i / "item1A.txt").is_file() else None) 
+        filed = indexed.get(i.name)
+        if filed is not None:
+            date_data.append({"year": filed[:4], "month": filed[5:7], "day": filed[8:10], "filing": i.name})
+            continue
+
+        # not in the filing index: read the date from the header
+        # (the fused pipeline does not keep cleaned filings; the raw header has the same date line)
+        folder = checkdate_path / i.name
+        if not (folder / "full-submission.txt").is_file():
+            folder = raw_path / i.name
+        date_data.append(check_date(folder)) 
     ordered_filings = order_filings(date_data)
 
     comps_list = []
@@ -80,47 +98,203 @@ def make_comps(cik):
         })
     return comps_list
 
-def concurrency_runner(writer, ciks):
+def concurrency_runner(sink, ciks, done=None):
     """
     Compute Levenshtein edit distance features for multiple CIKs using multiprocessing.
-    Runs `worker()` per CIK and writes the resulting rows to the output CSV.
+
+    Work is scheduled per comparison pair rather than per CIK: `plan_cik()` first
+    prepares every CIK's pairs, then `pair_worker()` tasks are dispatched largest
+    first (estimated cost len_a * len_b) so one firm with many long filings does
+    not leave the other workers idle. Each row is handed to `sink`
+    (a `feature_store.FeatureSink`) as soon as its pair completes, and failures
+    are recorded there with their traceback.
+
+    On SIGINT/SIGTERM, queued pairs are cancelled, running ones are drained and
+    written, and KeyboardInterrupt is raised; rerunning resumes from the rows on disk.
+
+    `done` maps a CIK to the `feature_store.done_key()`s of pairs that are already up to date.
+    Returns the comparison plan of every CIK that could be planned, {cik: {pair_key: (digest_a, digest_b)}},
+    for `feature_store.compact_features()`.
     """
+    done = done or {}
+    planned = {}
+    tasks = []
+
+    def add_plan(result):
+        cik, plan, cik_tasks = result
+        planned[cik] = plan
+        tasks.extend(cik_tasks)
+
+    stop, previous = _install_stop_handlers()
     try:
-        with ProcessPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            futures = {executor.submit(worker, cik): cik for cik in ciks}
-            
-            for fut in as_completed(futures):
-                print(fut)
-                rows = fut.result()
-                writer.writerows(rows)
-    except:
-        print("Skipped")
+        with ProcessPoolExecutor(max_workers=MAX_WORKERS, initializer=_ignore_stop_signals) as executor:
+            futures = {executor.submit(plan_cik, cik, done.get(cik, set())): {"cik": cik} for cik in ciks}
+            _drain(futures, add_plan, sink, stop)
+
+            tasks.sort(key=lambda t: t["len_a"] * t["len_b"], reverse=True)
+            futures = {
+                executor.submit(pair_worker, task): {
+                    "cik": task["cik"], "filing1": task["comp"]["filing1"], "filing2": task["comp"]["filing2"]
+                }
+                for task in ([] if stop.is_set() else tasks)
+            }
+            _drain(futures, sink.write, sink, stop)
+    finally:
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+
+    if stop.is_set():
+        print(f"\nInterrupted: {sink.written} rows saved, rerun to resume.")
+        raise KeyboardInterrupt
+    return planned
+
+def _drain(futures, on_result, sink, stop):
+    """
+    Consume `futures` as they finish, passing results to `on_result` and failures to `sink.fail()`.
+    Once `stop` is set, cancels what has not started yet and only drains running futures.
+    """
+    pending = set(futures)
+    while pending:
+        finished, pending = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+        for fut in finished:
+            if fut.cancelled():
+                continue
+            try:
+                on_result(fut.result())
+            except Exception as e:
+                if not stop.is_set():
+                    sink.fail(futures[fut], e)
+        if stop.is_set():
+            pending = {fut for fut in pending if not fut.cancel()}
+
+def _install_stop_handlers():
+    """
+    Route SIGINT/SIGTERM to a threading.Event instead of killing the run.
+    Returns (event, previous handlers by signal) so the caller can restore them.
+    """
+    stop = threading.Event()
+    previous = {}
+    if threading.current_thread() is threading.main_thread():
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            previous[sig] = signal.signal(sig, lambda signum, frame: stop.set())
+    return stop, previous
+
+def _ignore_stop_signals():
+    """
+    Worker initializer: leave SIGINT/SIGTERM to the parent so running pairs can finish.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+def plan_cik(cik, done=frozenset()):
+    """
+    Prepare the comparison pairs of a single CIK for pair-level scheduling.
+
+    Loads (tokenizing on a cache miss) every filing used by the pairs, so the CIK's
+    cached vocabulary is complete before its pairs are spread across processes.
+    Returns (cik, plan, tasks): the plan maps every current pair (cik, date_a, date_b)
+    to its content hashes, and the tasks are dicts with the pair, the content hashes
+    and token counts, skipping pairs whose key is in `done`.
+    """
+    plan = {}
+    tasks = []
+    for comp in make_comps(cik):
+        idsNew, keyNew = load_tokens(cik, _item1a_path(cik, comp["filing1"]))
+        idsOld, keyOld = load_tokens(cik, _item1a_path(cik, comp["filing2"]))
+        plan[(cik, comp["date1"], comp["date2"])] = (keyNew, keyOld)
+        if (cik, comp["date1"], comp["date2"], keyNew, keyOld) in done:
+            continue
+        tasks.append({
+            "cik": cik,
+            "comp": comp,
+            "digest_a": keyNew,
+            "digest_b": keyOld,
+            "len_a": len(idsNew),
+            "len_b": len(idsOld),
+        })
+    return cik, plan, tasks
+
+def pair_worker(task):
+    """
+    Compute the feature row of one comparison pair prepared by `plan_cik()`.
+    """
+    cik = task["cik"]
+    idsNew = tc.load_ids(cik, task["digest_a"])
+    idsOld = tc.load_ids(cik, task["digest_b"])
+    row = token_features(idsNew, idsOld, vocab_compounds(cik), task["comp"], cik)
+    row["digest_a"], row["digest_b"] = task["digest_a"], task["digest_b"]
+    return row
+
+def _item1a_path(cik, filing):
+    return INTERIM_ITEM1A_DIR / cik / "10-K" / filing / "item1A.txt"
 
 # ---------------------------------------------------------------------------------------
 
-def worker(cik):
+def worker(cik, done=frozenset()):
     """
     Compute feature rows for all consecutive filing comparisons for a single CIK.
     Returns a list of row dictionaries for writing to the output file.
+
+    Pairs whose key (with content hashes) is in `done` are skipped.
     """
     comps = make_comps(cik)
     rows = []
-    [rows.append(process_comps(comp, cik)) for comp in comps]
+    for comp in comps:
+        row = process_comps(comp, cik, done)
+        if row is not None:
+            rows.append(row)
     print(rows)
     return rows
 
 
-def process_comps(comp, cik):
+def process_comps(comp, cik, done=frozenset()):
+    """
+    Load the token IDs of two Item 1A texts for a comparison pair and compute feature metrics.
+    Returns the output dictionary produced by `token_features()` plus the content hashes
+    of both files, or None if the pair with this content is already in `done`.
+    """
+    idsNew, keyNew = load_tokens(cik, _item1a_path(cik, comp["filing1"]))
+    idsOld, keyOld = load_tokens(cik, _item1a_path(cik, comp["filing2"]))
+    if (cik, comp["date1"], comp["date2"], keyNew, keyOld) in done:
+        return None
+
+    row = token_features(idsNew, idsOld, vocab_compounds(cik), comp, cik)
+    row["digest_a"], row["digest_b"] = keyNew, keyOld
+    return row
+
+_COMPOUND_TABLES = {}  # cik -> compound_table() of the cached vocabulary
+
+def vocab_compounds(cik) -> np.ndarray:
+    """
+    Return the compound-score table of a CIK's cached vocabulary, extending it for new IDs.
+    """
+    table = compound_table(tc.vocab_words(cik), _COMPOUND_TABLES.get(cik))
+    _COMPOUND_TABLES[cik] = table
+    return table
+
+def load_tokens(cik, path):
+    """
+    Return (token_ids, digest) for an `item1A.txt`, tokenizing it only on a cache miss.
+
+    The cache is keyed by the SHA-256 of the file content, so edited files are
+    re-tokenized automatically. New words are appended to the CIK's vocabulary.
+    """
+    return cache_tokens(cik, path.read_bytes())
+
+def cache_tokens(cik, data: bytes):
     """
-    Load two Item 1A texts for a comparison pair and compute feature metrics.
-    Returns the output dictionary produced by `min_edit_levenshtein()`.
+    Same as `load_tokens()` for the raw bytes of an `item1A.txt` already in memory.
     """
-    filingNew, filingOld = comp["filing1"], comp["filing2"]
-    fileNew = INTERIM_ITEM1A_DIR / cik / "10-K" / filingNew / "item1A.txt"
-    fileOld = INTERIM_ITEM1A_DIR / cik / "10-K" / filingOld / "item1A.txt"
-    textNew = fileNew.read_text(encoding="utf-8", errors="ignore")
-    textOld = fileOld.read_text(encoding="utf-8", errors="ignore")
-    return min_edit_levenshtein(textNew, textOld, comp, cik)
+    key = tc.digest(data)
+    ids = tc.load_ids(cik, key)
+    if ids is not None:
+        return ids, key
+
+    index = tc.vocab_index(cik)
+    start = len(index)
+    [ids] = encode_tokens(tokenize(data.decode("utf-8", errors="ignore")), vocab=index)
+    tc.save_vocab(cik, index, start)
+    return tc.save_ids(cik, key, ids), key
 
 # --------------------------------------------------------------------------------------------------------------------
 #                                                VARIABLES FUNCTIONS
@@ -146,16 +320,66 @@ def mean_vader_compound(words) -> float:
         compounds.append(scores["compound"])
     return sum(compounds) / len(compounds) if len(compounds) != 0 else 0
 
-def levenshtein_tokens(a_tokens, b_tokens, cik):
+_WORD_COMPOUNDS = {}  # word -> VADER compound of the word on its own
+
+def word_compound(word) -> float:
+    """
+    VADER compound score of a single word, identical to `_sia.polarity_scores(word)["compound"]`.
+
+    Words with no lexicon entry (even after VADER strips a leading/trailing
+    punctuation mark) always score 0.0, so the full analyzer only runs once per
+    distinct lexicon word; results are memoized for the life of the process.
+    """
+    w = (word or "").strip()
+    score = _WORD_COMPOUNDS.get(w)
+    if score is None:
+        forms = {w, w[1:], w[:-1], w.strip(string.punctuation)}
+        if w and any(f.lower() in _sia.lexicon for f in forms):
+            score = _sia.polarity_scores(w)["compound"]
+        else:
+            score = 0.0
+        _WORD_COMPOUNDS[w] = score
+    return score
+
+def compound_table(words, table=None) -> np.ndarray:
+    """
+    Return a float64 array with the VADER compound score of each vocabulary ID.
+
+    `words` is the ID -> word list. If a `table` built for an earlier, shorter
+    version of the same vocabulary is given, only the new IDs are scored.
+    """
+    start = 0 if table is None else len(table)
+    if start == len(words):
+        return table
+    extra = np.fromiter((word_compound(w) for w in words[start:]), dtype=np.float64, count=len(words) - start)
+    return extra if table is None else np.concatenate([table, extra])
+
+def mean_compound(ids, compounds) -> float:
+    """
+    Average compound score over token IDs using a `compound_table()` lookup.
+    Returns exactly the same value as `mean_vader_compound()` on the matching words.
+    """
+    if len(ids) == 0:
+        return 0
+    scores = compounds[np.asarray(ids, dtype=np.intp)].tolist()
+    # plain sum() like mean_vader_compound(): numpy's sums round differently from
+    # the compensated sum() of Python 3.12+
+    return sum(scores) / len(scores)
+
+def levenshtein_tokens(a_tokens, b_tokens, cik, max_distance=None):
     """
     Compute token-level Levenshtein distance and identify newly introduced tokens.
     Returns (distance, new_words).
+
+    Pure-Python reference implementation; `max_distance` only caps the result.
     """
     m, n = len(a_tokens), len(b_tokens)
     if n > m:
         # ensure n <= m for memory efficiency
         a_tokens, b_tokens = b_tokens, a_tokens
         m, n = n, m
+    if n == 0:
+        return (m if max_distance is None else min(m, max_distance)), list(a_tokens)
 
     prev = list(range(n + 1))  # row 0..n
     for i in range(1, m + 1):
@@ -168,21 +392,168 @@ def levenshtein_tokens(a_tokens, b_tokens, cik):
                 cur[j-1] + 1,     # insertion
                 prev[j-1] + cost  # substitution (0 if match)
             )
-
-        if (j % 1000 == 0) or (j == n):  # adjust 1000 for your speed/verbosity
-            done_cells = (i - 1) * n + j
-            total_cells = m * n
-            pct = (done_cells / total_cells) * 100 if total_cells else 100.0
-            sys.stdout.write(f"\rCik: {cik} Progress: {pct:6.2f}%  (row {i}/{m}, col {j}/{n})")
-            sys.stdout.flush()
-
-        b_set = set(b_tokens)
-        new_words = [t for t in a_tokens if t not in b_set]
-    # after both loops finish:
-        print()
         prev = cur
+
+    b_set = set(b_tokens)
+    new_words = [t for t in a_tokens if t not in b_set]
+    if max_distance is not None:
+        return min(prev[n], max_distance), new_words
     return prev[n], new_words
 
+# --------------------------------------------------------------------------------------------------------------------
+#                                              FAST EDIT DISTANCE ENGINE
+# --------------------------------------------------------------------------------------------------------------------
+
+def encode_tokens(*token_lists, vocab=None):
+    """
+    Map tokens to integer IDs using one vocabulary shared by all the given lists.
+    Returns one list of IDs per input list, in the same order.
+
+    Pass `vocab` (token -> ID dict) to reuse an existing vocabulary; unseen tokens are added to it.
+    """
+    vocab = {} if vocab is None else vocab
+    return [[vocab.setdefault(t, len(vocab)) for t in tokens] for tokens in token_lists]
+
+def _trim_common(a_ids, b_ids):
+    """
+    Drop the shared prefix and suffix of two sequences; they never change the distance.
+    """
+    lo, hi_a, hi_b = 0, len(a_ids), len(b_ids)
+    while lo < hi_a and lo < hi_b and a_ids[lo] == b_ids[lo]:
+        lo += 1
+    while hi_a > lo and hi_b > lo and a_ids[hi_a - 1] == b_ids[hi_b - 1]:
+        hi_a -= 1
+        hi_b -= 1
+    return a_ids[lo:hi_a], b_ids[lo:hi_b]
+
+def levenshtein_ids(a_ids, b_ids, max_distance=None) -> int:
+    """
+    Compute the Levenshtein distance between two sequences of integer token IDs.
+
+    Bit-parallel algorithm (Myers 1999, global-distance form by Hyyrö): one DP column
+    over the shorter sequence is packed into a Python int, so each token of the
+    longer sequence costs a fixed number of big-integer operations.
+    If `max_distance` is given, returns `max_distance` as soon as the distance is
+    known to be at least that large.
+    """
+    a_ids, b_ids = _trim_common(a_ids, b_ids)
+
+    if len(b_ids) > len(a_ids):
+        a_ids, b_ids = b_ids, a_ids
+    m = len(b_ids)
+    if m == 0:
+        return len(a_ids) if max_distance is None else min(len(a_ids), max_distance)
+
+    peq = {}                                    # token -> bitmask of its positions in b
+    for i, t in enumerate(b_ids):
+        peq[t] = peq.get(t, 0) | (1 << i)
+
+    full = (1 << m) - 1
+    last = 1 << (m - 1)
+    pv, mv, score = full, 0, m
+    remaining = len(a_ids)
+    for t in a_ids:
+        eq = peq.get(t, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & full)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        ph = ((ph << 1) | 1) & full
+        mh = (mh << 1) & full
+        pv = mh | (~(xv | ph) & full)
+        mv = ph & xv
+
+        # the last row can drop by at most one per remaining token
+        remaining -= 1
+        if max_distance is not None and score - remaining >= max_distance:
+            return max_distance
+    return score
+
+def levenshtein_ids_banded(a_ids, b_ids, max_distance=None) -> int:
+    """
+    Compute the Levenshtein distance between two ID sequences in O((m + n) * k) time,
+    where k is the distance itself.
+
+    Ukkonen's diagonal-transition method: for d = 0, 1, 2, ... it tracks the
+    furthest row reachable with d edits on each diagonal |j - i| <= d and slides
+    along matching tokens, so near-identical filings finish after a few rounds.
+    If `max_distance` is given, stops after that many rounds and returns
+    `max_distance`, meaning "at least `max_distance`".
+    """
+    a_ids, b_ids = _trim_common(a_ids, b_ids)
+    m, n = len(a_ids), len(b_ids)
+    target = n - m                              # diagonal of the (m, n) corner
+
+    # fr[k + offset] = furthest row i on diagonal k = j - i reachable with d edits
+    d = 0
+    offset = 0
+    fr = [0]
+    while True:
+        if abs(target) <= d and fr[target + offset] >= m:
+            return d
+        if max_distance is not None and d >= max_distance:
+            return max_distance
+
+        d += 1
+        prev, prev_offset = fr, offset
+        offset = d
+        fr = [-1] * (2 * d + 1)
+        for k in range(max(-d, -m), min(d, n) + 1):
+            i = max(0, -k)                      # first cell of the diagonal costs |k| <= d
+            pk = k + prev_offset
+            if 0 <= pk < len(prev):
+                i = max(i, prev[pk] + 1)        # substitution
+            if 0 <= pk + 1 < len(prev):
+                i = max(i, prev[pk + 1] + 1)    # deletion of a[i]
+            if 0 <= pk - 1 < len(prev):
+                i = max(i, prev[pk - 1])        # insertion of b[j]
+            i = min(i, m, n - k)
+            while i < m and i + k < n and a_ids[i] == b_ids[i + k]:
+                i += 1
+            fr[k + offset] = i
+
+def _levenshtein_ids_reference(a_ids, b_ids, max_distance=None) -> int:
+    """
+    Distance-only adapter around the pure-Python `levenshtein_tokens()`.
+    """
+    return levenshtein_tokens(a_ids, b_ids, None, max_distance)[0]
+
+_DISTANCE_ENGINES = {
+    "bitparallel": levenshtein_ids,
+    "banded": levenshtein_ids_banded,
+    "reference": _levenshtein_ids_reference,
+}
+
+# --------------------------------------------------------------------------------------------------------------------
+#                                                 TOKEN DIFF STAGE
+# --------------------------------------------------------------------------------------------------------------------
+
+class TokenDiff(NamedTuple):
+    added: list
+    removed: list
+    unchanged: list
+
+def token_diff(a_tokens, b_tokens) -> TokenDiff:
+    """
+    Split the tokens of a comparison pair by what changed, in one hashing pass per list.
+
+    `a_tokens` is the newer filing and `b_tokens` the older one:
+      - added: tokens of `a` whose word never appears in `b`,
+      - removed: tokens of `b` whose word never appears in `a`,
+      - unchanged: tokens of `a` whose word also appears in `b`.
+    Token order (and repetitions) of the source list are preserved.
+    """
+    a_set, b_set = set(a_tokens), set(b_tokens)
+    added, unchanged = [], []
+    for t in a_tokens:
+        (unchanged if t in b_set else added).append(t)
+    removed = [t for t in b_tokens if t not in a_set]
+    return TokenDiff(added, removed, unchanged)
+
 def jaccard_similarity(text_a: str, text_b: str) -> float:
     """
     Compute Jaccard similarity between the token sets of two texts.
@@ -193,22 +564,41 @@ def jaccard_similarity(text_a: str, text_b: str) -> float:
         return 1.0
     return len(A & B) / len(A | B)
 
-def min_edit_levenshtein(text_a: str, text_b: str, dict, cik):
+def min_edit_levenshtein(text_a: str, text_b: str, dict, cik, engine: str = LEVENSHTEIN_ENGINE,
+                         max_distance=LEVENSHTEIN_MAX_DISTANCE):
     """
     Compute disclosure-change features between two Item 1A texts.
     Returns a dictionary with levenshtein, lengths, and sentiment of newly added words.
     """
-    A, B = tokenize(text_a), tokenize(text_b)
-    dist, new_words = levenshtein_tokens(A, B, cik)
-    denom = len(A) + len(B)
+    vocab = {}
+    a_ids, b_ids = encode_tokens(tokenize(text_a), tokenize(text_b), vocab=vocab)
+    return token_features(a_ids, b_ids, compound_table(list(vocab)), dict, cik, engine, max_distance)
+
+def token_features(a_ids, b_ids, compounds, dict, cik, engine: str = LEVENSHTEIN_ENGINE,
+                   max_distance=LEVENSHTEIN_MAX_DISTANCE):
+    """
+    Compute disclosure-change features from the token IDs of two Item 1A texts.
+    `compounds` is the `compound_table()` of the vocabulary the IDs refer to.
+
+    The distance and the added words come from independent stages: `engine` selects
+    the distance implementation ("bitparallel", "banded" or "reference") and
+    `token_diff()` provides the words scored for sentiment.
+    With `max_distance` set, pairs at or above the cutoff get `distance == max_distance`
+    and `distance_capped == True`.
+    """
+    a_ids, b_ids = np.asarray(a_ids).tolist(), np.asarray(b_ids).tolist()
+    dist = _DISTANCE_ENGINES[engine](a_ids, b_ids, max_distance)
+    diff = token_diff(a_ids, b_ids)
+    denom = len(a_ids) + len(b_ids)
     lev = 1.0 - (dist / denom if denom else 0.0)
     return {
         "cik": cik, 
         "date_a": dict["date1"], 
         "date_b": dict["date2"], 
         "distance": dist, 
+        "distance_capped": max_distance is not None and dist >= max_distance,
         "levenshtein": lev, 
-        "len_a": len(A), 
-        "len_b": len(B), 
-        "sentiment": mean_vader_compound(new_words)
+        "len_a": len(a_ids), 
+        "len_b": len(b_ids), 
+        "sentiment": mean_compound(diff.added, compounds)
         }
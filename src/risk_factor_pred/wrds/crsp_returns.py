@@ -1,21 +1,30 @@
-from risk_factor_pred.config import INTERIM_ITEM1A_DIR, CIK_LIST
+from risk_factor_pred.config import CIK_LIST, RETURNS_FILE, RETURNS_CACHE, RETURNS_LINKS, CRSP_BATCH_SIZE, RETURNS_START_DATE, RETURNS_END_DATE
+from risk_factor_pred.config import RETURNS_DAILY_DIR, MARKET_DAILY_FILE, CRSP_DAILY_BATCH_SIZE, MARKET_INDEX, RETURNS_DORMANT_MONTHS
+from risk_factor_pred.datasets import storage as st
+from typing import Iterable, Optional
 import pandas as pd
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
 import wrds
+import shutil
+import os
 
 
 def querymaker(cik):
     """
     Build the WRDS SQL query to pull monthly CRSP returns for a single CIK.
 
-    Returns a query string filtered to common link types and a fixed date range.
+    Returns a query string filtered to common link types and the
+    `RETURNS_START_DATE`-`RETURNS_END_DATE` date range.
     """
+    end_filter = f"AND m.date <= '{RETURNS_END_DATE}'" if RETURNS_END_DATE else ""
     query = f"""
     SELECT 
         c.cik, 
         c.conm as company_name, 
         m.date, 
-        m.ret
+        m.ret, 
+        m.permno, 
+        link.linkprim
     FROM 
         crsp.msf as m
     JOIN 
@@ -26,8 +35,8 @@ def querymaker(cik):
         ON link.gvkey = c.gvkey
     WHERE 
         c.cik = '{cik}'            
-        AND m.date >= '2006-01-01'      
-        AND m.date <= '2025-10-31'
+        AND m.date >= '{RETURNS_START_DATE}'      
+        {end_filter}
         AND link.linktype IN ('LU', 'LC')
         AND link.linkprim IN ('P', 'C')
         AND m.date >= link.linkdt
@@ -35,33 +44,487 @@ def querymaker(cik):
     """
     return query
 
-def df_with_returns():
+def batch_querymaker(after: bool = False):
     """
-    Download and combine monthly return data for all CIK folders in `INTERIM_ITEM1A_DIR`.
+    Build the WRDS SQL query to pull monthly CRSP returns for a batch of CIKs.
 
-    For each CIK, runs the WRDS query, keeps (cik, date, ret), and concatenates results
-    into a single dataframe.
+    Same joins, link filters and date range as `querymaker()`; the CIKs are bound
+    as an expanding `:ciks` parameter, i.e. `c.cik IN (...)`, and the dates as
+    `:start` / `:end`. With `after`, only months after `:after` are returned.
     """
-    list_cik_df = pd.read_csv(CIK_LIST)
-    
-    db = wrds.Connection(wrds_username='username')
-    
-    #ciks = [p.name for p in INTERIM_ITEM1A_DIR.iterdir()]
-    ciks = list_cik_df['CIK'].unique().tolist()
-    ciks = [str(cik).zfill(10) for cik in ciks]
-    
-    dfs = []
+    end_filter = "AND m.date <= :end" if RETURNS_END_DATE else ""
+    after_filter = "AND m.date > :after" if after else ""
+    query = f"""
+    SELECT 
+        c.cik, 
+        m.date, 
+        m.ret, 
+        m.permno, 
+        link.linkprim
+    FROM 
+        crsp.msf as m
+    JOIN 
+        crsp.ccmxpf_linktable as link
+        ON m.permno = link.lpermno
+    JOIN
+        comp.company as c
+        ON link.gvkey = c.gvkey
+    WHERE 
+        c.cik IN :ciks
+        AND m.date >= :start
+        {end_filter}
+        {after_filter}
+        AND link.linktype IN ('LU', 'LC')
+        AND link.linkprim IN ('P', 'C')
+        AND m.date >= link.linkdt
+        AND (m.date <= link.linkenddt OR link.linkenddt IS NULL)
+    """
+    return text(query).bindparams(bindparam("ciks", expanding=True))
 
+def _date_params(after=None) -> dict:
+    params = {"start": RETURNS_START_DATE}
+    if RETURNS_END_DATE:
+        params["end"] = RETURNS_END_DATE
+    if after is not None:
+        params["after"] = after
+    return params
+
+def _returns_per_cik(engine, ciks):
+    """
+    One query (and connection) per CIK.
+    """
+    dfs = []
+    failed = []
     for cik in ciks:
         query = querymaker(cik)
         try:
-            with db.engine.connect() as conn:
+            with engine.connect() as conn:
                 df = pd.read_sql_query(text(query), conn)
 
             dfs.append(df)
             print(f"{cik}: ok ({len(df)} rows)")
         except Exception as e:
+            failed.append(cik)
             print(f"{cik}: error: {e}")
-    cols = ["cik", "date", "ret"]
+    return dfs, failed
+
+def _iter_batched(engine, stmt, ciks, batch_size, params=None):
+    """
+    Run `stmt` for chunks of `batch_size` CIKs (bound as `:ciks`) over a single connection,
+    yielding (chunk, DataFrame) as each chunk arrives (DataFrame None if the chunk failed).
+    """
+    with engine.connect() as conn:
+        for i in range(0, len(ciks), batch_size):
+            chunk = ciks[i:i + batch_size]
+            try:
+                df = pd.read_sql_query(stmt, conn, params={**(params or {}), "ciks": chunk})
+            except Exception as e:
+                # a failed statement aborts the transaction; roll back so the next chunk can run
+                conn.rollback()
+                print(f"CIKs {i + 1}-{i + len(chunk)}/{len(ciks)}: error: {e}")
+                yield chunk, None
+                continue
+            print(f"CIKs {i + 1}-{i + len(chunk)}/{len(ciks)}: ok ({len(df)} rows)")
+            yield chunk, df
+
+def _read_batched(engine, stmt, ciks, batch_size, params=None):
+    """
+    Run `stmt` for chunks of `batch_size` CIKs (bound as `:ciks`) over a single connection.
+    Returns (list of DataFrames, CIKs of the chunks that failed).
+    """
+    dfs = []
+    failed = []
+    for chunk, df in _iter_batched(engine, stmt, ciks, batch_size, params):
+        if df is None:
+            failed.extend(chunk)
+        else:
+            dfs.append(df)
+    return dfs, failed
+
+def _returns_batched(engine, ciks, batch_size, after=None):
+    """
+    One query per chunk of `batch_size` CIKs, all over a single connection
+    (only months after `after`, a "yyyy-mm-dd" string, if given).
+    """
+    return _read_batched(engine, batch_querymaker(after is not None), ciks, batch_size, _date_params(after))
+
+def _universe(ciks: Optional[Iterable[str]]) -> list:
+    if ciks is None:
+        list_cik_df = pd.read_csv(CIK_LIST)
+        #ciks = [p.name for p in INTERIM_ITEM1A_DIR.iterdir()]
+        ciks = list_cik_df['CIK'].unique().tolist()
+    return [str(cik).zfill(10) for cik in ciks]
+
+def df_with_returns(ciks: Optional[Iterable[str]] = None, engine=None, batch_size: Optional[int] = CRSP_BATCH_SIZE):
+    """
+    Download and combine monthly return data for the CIKs in `CIK_LIST` (or `ciks`).
+
+    With `batch_size`, CIKs are queried in chunks over one connection; with None,
+    one query per CIK (the previous behaviour). `engine` defaults to a WRDS
+    connection. Keeps (cik, date, ret), saves them to `RETURNS_CACHE` and returns them.
+    """
+    ciks = _universe(ciks)
+
+    if engine is None:
+        engine = wrds.Connection(wrds_username='username').engine
+
+    if batch_size:
+        dfs, failed = _returns_batched(engine, ciks, batch_size)
+    else:
+        dfs, failed = _returns_per_cik(engine, ciks)
+
+    # link snapshot for later `refresh_returns()` runs
+    done = [c for c in ciks if c not in set(failed)]
+    links = pull_links(engine, done, batch_size or CRSP_BATCH_SIZE)
+    if links is not None:
+        save_links(links, done)
+
+    cols = ["cik", "date", "ret", "permno", "linkprim"]
     dfs = [df.reindex(columns=cols) for df in dfs if df is not None and not df.empty]
-    return pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame()
+    if not dfs:
+        return pd.DataFrame()
+    df = save_returns_cache(pd.concat(dfs, ignore_index=True))
+    return df
+
+# --------------------------------------------------------------------------------------------------------------------
+#                                                RETURNS CACHE
+# --------------------------------------------------------------------------------------------------------------------
+
+def normalize_returns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Return (cik, date, ret) with 10-digit string CIKs, datetime dates and float returns,
+    one row per (cik, date), sorted by key.
+
+    A CIK linked to several PERMNOs has several returns per date. With the `permno`
+    and `linkprim` columns of the queries, the primary link ('P') wins, then the
+    lowest PERMNO, so every pull keeps the same row whatever order the database
+    returned; without them, the first row is kept.
+    """
+    df = df.copy()
+    df["cik"] = df["cik"].astype(str).str.replace(r"\.0$", "", regex=True).str.zfill(10)
+    df["date"] = pd.to_datetime(df["date"])
+    df["ret"] = pd.to_numeric(df["ret"], errors="coerce").astype("float64")
+    keys = ["cik", "date"]
+    if "permno" in df.columns and "linkprim" in df.columns:
+        df["secondary"] = df["linkprim"].astype(str).str.strip() != "P"
+        df["permno"] = pd.to_numeric(df["permno"], errors="coerce")
+        keys += ["secondary", "permno"]
+    df = df.sort_values(keys, kind="stable").drop_duplicates(["cik", "date"])
+    return df[["cik", "date", "ret"]].reset_index(drop=True)
+
+def save_returns_cache(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Normalize monthly returns (see `normalize_returns()`) and write them to the typed
+    Parquet `RETURNS_CACHE` (int32 CIKs, date32 dates), replacing it atomically.
+    Returns the normalized frame.
+    """
+    df = normalize_returns(df)
+    st.write_table(df, RETURNS_CACHE, partition=False)
+    return df
+
+def _read_returns(path) -> pd.DataFrame:
+    """
+    Read returns written through `st.write_table()`, with CIKs back as 10-digit strings.
+    """
+    df = st.read_table(path)
+    df["cik"] = st.cik_to_str(df["cik"])
+    return df
+
+def load_returns_cache() -> pd.DataFrame:
+    """
+    Return `RETURNS_CACHE` (an empty (cik, date, ret) frame if there is none).
+    """
+    if not RETURNS_CACHE.is_file():
+        return normalize_returns(pd.DataFrame(columns=["cik", "date", "ret"]))
+    return _read_returns(RETURNS_CACHE)
+
+def load_returns() -> pd.DataFrame:
+    """
+    Return the monthly returns panel from `RETURNS_CACHE`, or from the legacy `RETURNS_FILE` if there is no cache.
+    """
+    if RETURNS_CACHE.is_file():
+        return _read_returns(RETURNS_CACHE)
+    return pd.read_csv(RETURNS_FILE)
+
+# --------------------------------------------------------------------------------------------------------------------
+#                                                INCREMENTAL REFRESH
+# --------------------------------------------------------------------------------------------------------------------
+
+LINK_COLUMNS = ["cik", "gvkey", "lpermno", "linktype", "linkprim", "linkdt", "linkenddt"]
+
+def links_querymaker():
+    """
+    Build the query for the CCM links (types/prims used by the returns query) of a batch of CIKs.
+    """
+    query = """
+    SELECT 
+        c.cik, 
+        link.gvkey, 
+        link.lpermno, 
+        link.linktype, 
+        link.linkprim, 
+        link.linkdt, 
+        link.linkenddt
+    FROM 
+        crsp.ccmxpf_linktable as link
+    JOIN
+        comp.company as c
+        ON link.gvkey = c.gvkey
+    WHERE 
+        c.cik IN :ciks
+        AND link.linktype IN ('LU', 'LC')
+        AND link.linkprim IN ('P', 'C')
+    """
+    return text(query).bindparams(bindparam("ciks", expanding=True))
+
+def _normalize_links(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    All columns as strings ("" for missing), CIKs padded, rows sorted, so snapshots compare exactly.
+    """
+    df = df.reindex(columns=LINK_COLUMNS).copy()
+    for col in LINK_COLUMNS:
+        df[col] = df[col].map(lambda v: "" if pd.isna(v) else str(v)).str.replace(r"\.0$", "", regex=True)
+        if col in ("linkdt", "linkenddt"):
+            df[col] = df[col].str[:10]
+    df["cik"] = df["cik"].str.zfill(10)
+    return df.sort_values(LINK_COLUMNS).reset_index(drop=True)
+
+def pull_links(engine, ciks, batch_size: int = CRSP_BATCH_SIZE) -> Optional[pd.DataFrame]:
+    """
+    Return the current links of `ciks`, or None if any chunk failed.
+    """
+    dfs, failed = _read_batched(engine, links_querymaker(), ciks, batch_size)
+    if failed:
+        return None
+    return _normalize_links(pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame(columns=LINK_COLUMNS))
+
+def load_links() -> pd.DataFrame:
+    if not RETURNS_LINKS.is_file():
+        return _normalize_links(pd.DataFrame(columns=LINK_COLUMNS))
+    return pd.read_parquet(RETURNS_LINKS)
+
+def save_links(links: pd.DataFrame, ciks) -> None:
+    """
+    Store `links` as the snapshot of `ciks` in `RETURNS_LINKS`; other CIKs keep their snapshot.
+    """
+    ciks = set(ciks)
+    old = load_links()
+    links = _normalize_links(pd.concat([old[~old["cik"].isin(ciks)], links[links["cik"].isin(ciks)]], ignore_index=True))
+    RETURNS_LINKS.parent.mkdir(parents=True, exist_ok=True)
+    tmp = RETURNS_LINKS.with_suffix(".parquet.part")
+    links.to_parquet(tmp, index=False)
+    os.replace(tmp, RETURNS_LINKS)
+
+def changed_links(old: pd.DataFrame, new: pd.DataFrame, ciks) -> set:
+    """
+    Return the CIKs (among `ciks`) whose set of link rows differs between two snapshots.
+    """
+    def by_cik(df):
+        rows = {}
+        for row in df.itertuples(index=False):
+            rows.setdefault(row.cik, set()).add(tuple(row))
+        return rows
+
+    old_rows, new_rows = by_cik(old), by_cik(new)
+    return {cik for cik in ciks if old_rows.get(cik, set()) != new_rows.get(cik, set())}
+
+def refresh_returns(ciks: Optional[Iterable[str]] = None, engine=None, batch_size: int = CRSP_BATCH_SIZE,
+                    recheck_dormant: bool = False) -> pd.DataFrame:
+    """
+    Update `RETURNS_CACHE` with only what changed in CRSP since the last pull.
+
+    Each CIK's high-water mark is its last cached month, and only later months are
+    queried, in batches of CIKs that share the same mark. CIKs whose mark is more
+    than `RETURNS_DORMANT_MONTHS` behind the latest cached month (delisted firms)
+    are skipped unless `recheck_dormant`; a firm that returns to CRSP gets new CCM
+    links and is picked up below. CIKs whose CCM links changed since the last
+    snapshot (`RETURNS_LINKS`), or that are linked but have no cached rows, are
+    re-pulled over the whole window and their cached rows replaced; CIKs without
+    links are skipped. Without a cache, runs a full `df_with_returns()`. Returns
+    the merged panel.
+    """
+    ciks = _universe(ciks)
+    if not RETURNS_CACHE.is_file():
+        return df_with_returns(ciks, engine=engine, batch_size=batch_size)
+
+    if engine is None:
+        engine = wrds.Connection(wrds_username='username').engine
+
+    cached = load_returns_cache()
+    old_links = load_links()
+    links = pull_links(engine, ciks, batch_size)
+    if links is None:
+        raise RuntimeError("Could not pull the CCM link table; nothing was refreshed")
+
+    hwm = cached.groupby("cik")["date"].max()
+    linked = set(links["cik"])
+    repull = changed_links(old_links, links, ciks) | {cik for cik in ciks if cik not in hwm.index and cik in linked}
+    # CIKs without links cannot have returns
+    incremental = [cik for cik in ciks if cik not in repull and cik in hwm.index]
+    dormant_before = hwm.max() - pd.DateOffset(months=RETURNS_DORMANT_MONTHS)
+    dormant = [cik for cik in incremental if hwm[cik] < dormant_before]
+    incremental = [cik for cik in incremental if hwm[cik] >= dormant_before]
+    print(f"{len(ciks)} CIKs: {len(repull)} re-pulled in full (link changes or no cached rows), "
+          f"{len(incremental)} incremental, {len(dormant)} dormant ({'re-checked' if recheck_dormant else 'skipped'}), "
+          f"{len(ciks) - len(repull) - len(incremental) - len(dormant)} without links")
+
+    dfs, failed = _returns_batched(engine, sorted(repull), batch_size)
+
+    # one set of queries per high-water mark, so no CIK is queried before its own mark
+    by_mark = {}
+    for cik in incremental:
+        by_mark.setdefault(hwm[cik], []).append(cik)
+    inc_dfs = []
+    for mark, group in sorted(by_mark.items()):
+        group_dfs, group_failed = _returns_batched(engine, group, batch_size, after=mark.strftime("%Y-%m-%d"))
+        inc_dfs += group_dfs
+        failed += group_failed
+
+    # dormant CIKs rarely have new rows: one pass from the earliest of their marks,
+    # dropping the rows at or before each CIK's own mark below
+    dormant_dfs = []
+    if recheck_dormant and dormant:
+        after = min(hwm[cik] for cik in dormant).strftime("%Y-%m-%d")
+        dormant_dfs, dormant_failed = _returns_batched(engine, dormant, batch_size, after=after)
+        failed += dormant_failed
+
+    cols = ["cik", "date", "ret", "permno", "linkprim"]
+    new_rows = [normalize_returns(d.reindex(columns=cols)) for d in dfs + inc_dfs if not d.empty]
+    for d in dormant_dfs:
+        if not d.empty:
+            d = normalize_returns(d.reindex(columns=cols))
+            new_rows.append(d[d["date"] > d["cik"].map(hwm)])
+
+    # replace the rows of re-pulled CIKs; failed ones keep their old rows and old links (retried next time)
+    replaced = repull - set(failed)
+    kept = cached[~cached["cik"].isin(replaced)]
+    df = save_returns_cache(pd.concat(new_rows + [kept], ignore_index=True))
+
+    failed = set(failed)
+    save_links(links, set(ciks) - failed)
+
+    added = sum(len(d) for d in new_rows)
+    print(f"{added} rows pulled, {len(df)} rows cached" + (f", {len(failed)} CIKs failed" if failed else ""))
+    return df
+
+# --------------------------------------------------------------------------------------------------------------------
+#                                                DAILY RETURNS
+# --------------------------------------------------------------------------------------------------------------------
+
+def daily_querymaker():
+    """
+    Build the WRDS SQL query for daily CRSP returns (`crsp.dsf`) of a batch of CIKs,
+    with the joins, link filters and `:start` / `:end` dates of `batch_querymaker()`.
+    """
+    end_filter = "AND d.date <= :end" if RETURNS_END_DATE else ""
+    query = f"""
+    SELECT 
+        c.cik, 
+        d.date, 
+        d.ret, 
+        d.permno, 
+        link.linkprim
+    FROM 
+        crsp.dsf as d
+    JOIN 
+        crsp.ccmxpf_linktable as link
+        ON d.permno = link.lpermno
+    JOIN
+        comp.company as c
+        ON link.gvkey = c.gvkey
+    WHERE 
+        c.cik IN :ciks
+        AND d.date >= :start
+        {end_filter}
+        AND link.linktype IN ('LU', 'LC')
+        AND link.linkprim IN ('P', 'C')
+        AND d.date >= link.linkdt
+        AND (d.date <= link.linkenddt OR link.linkenddt IS NULL)
+    """
+    return text(query).bindparams(bindparam("ciks", expanding=True))
+
+def market_querymaker():
+    """
+    Build the query for the daily `MARKET_INDEX` return of `crsp.dsi`, as (date, mkt).
+    """
+    end_filter = "AND date <= :end" if RETURNS_END_DATE else ""
+    query = f"""
+    SELECT 
+        date, 
+        {MARKET_INDEX} as mkt
+    FROM 
+        crsp.dsi
+    WHERE 
+        date >= :start
+        {end_filter}
+    """
+    return text(query)
+
+def pull_daily_returns(ciks: Optional[Iterable[str]] = None, engine=None, batch_size: int = CRSP_DAILY_BATCH_SIZE) -> list:
+    """
+    Pull daily returns for the CIKs in `CIK_LIST` (or `ciks`) and the daily market return.
+
+    Each chunk of `batch_size` CIKs is normalized (see `normalize_returns()`) and
+    written as its own partition `RETURNS_DAILY_DIR/part-NNNNN.parquet` as soon as
+    it arrives, so the daily panel (about 20x the monthly one) is never held in
+    memory. The partitions replace the previous ones only once the pull is done;
+    CIKs of chunks that failed keep their rows from the previous partitions.
+    The market return goes to `MARKET_DAILY_FILE`. Returns the CIKs that failed.
+    """
+    ciks = _universe(ciks)
+
+    if engine is None:
+        engine = wrds.Connection(wrds_username='username').engine
+
+    with engine.connect() as conn:
+        market = pd.read_sql_query(market_querymaker(), conn, params=_date_params())
+    market["date"] = pd.to_datetime(market["date"])
+    market["mkt"] = pd.to_numeric(market["mkt"], errors="coerce").astype("float64")
+    st.write_table(market.drop_duplicates("date").sort_values("date").reset_index(drop=True), MARKET_DAILY_FILE, partition=False)
+
+    staging = RETURNS_DAILY_DIR.with_name(RETURNS_DAILY_DIR.name + ".part")
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+
+    failed = []
+    rows = part = 0
+    for part, (chunk, df) in enumerate(_iter_batched(engine, daily_querymaker(), ciks, batch_size, _date_params()), 1):
+        if df is None:
+            failed.extend(chunk)
+            continue
+        if df.empty:
+            continue
+        df = normalize_returns(df)
+        st.write_table(df, staging / f"part-{part:05d}.parquet", partition=False)
+        rows += len(df)
+
+    # failed CIKs keep the daily returns of the previous pull
+    if failed:
+        failed_ciks = st.cik_to_int(failed)
+        for old in daily_partitions():
+            df = st.read_table(old)
+            df = df[df["cik"].isin(failed_ciks)]
+            if len(df):
+                part += 1
+                st.write_table(df, staging / f"part-{part:05d}.parquet", partition=False)
+                rows += len(df)
+
+    shutil.rmtree(RETURNS_DAILY_DIR, ignore_errors=True)
+    os.replace(staging, RETURNS_DAILY_DIR)
+    print(f"{rows} daily returns in {len(list(RETURNS_DAILY_DIR.glob('*.parquet')))} partitions, "
+          f"{len(market)} market days" + (f", {len(failed)} CIKs failed" if failed else ""))
+    return failed
+
+def daily_partitions() -> list:
+    """
+    Return the partition files of `RETURNS_DAILY_DIR`, in order.
+    """
+    if not RETURNS_DAILY_DIR.is_dir():
+        return []
+    return sorted(RETURNS_DAILY_DIR.glob("part-*.parquet"))
+
+def load_market() -> pd.DataFrame:
+    """
+    Return the daily market returns (date, mkt) of `MARKET_DAILY_FILE`, sorted by date.
+    """
+    return st.read_table(MARKET_DAILY_FILE)
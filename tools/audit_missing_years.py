@@ -1,14 +1,16 @@
 import pandas as pd
-from risk_factor_pred.config import SEC_DIR, TABLES_DIR
+from risk_factor_pred.config import RAW_EDGAR_DIR, FEATURES_FILE, INTERIM_FEATURES_DIR
+from risk_factor_pred.edgar import filing_index as fi
 import re
 
 """
 This script audits missing filing years in the features dataset.
 
-For each CIK folder under `SEC_DIR`, it extracts filing years from the accession
-folder names and compares them to the years covered by `features.csv`. Any
-filing years that are present on disk but missing from the features output
-are collected and saved to `missing_years.csv`.
+For each CIK folder under `RAW_EDGAR_DIR`, it looks up the filing year of every
+accession in the filing index (falling back to the year in the accession name)
+and compares them to the years covered by `features.csv`. Any filing years that
+are present on disk but missing from the features output are collected and saved
+to `missing_years.csv`.
 """
 
 def find_year(pname):
@@ -23,24 +25,35 @@ def find_year(pname):
     year = 1900 + yy if yy >= 70 else 2000 + yy
     return year
 
+def filing_year(pname):
+    """
+    Return the filing year of an accession from the filing index, or from its name if it is not indexed.
+    """
+    filed = filed_dates.get(pname)
+    return filed[:4] if isinstance(filed, str) else str(find_year(pname))
+
+fi.backfill()
+filings = fi.load_filings()
+filed_dates = dict(zip(filings["accession"], filings["filed"]))
+
 df = pd.DataFrame(columns=['cik', 'year'])
 
-features_df = pd.read_csv(TABLES_DIR / 'features.csv')
+features_df = pd.read_csv(FEATURES_FILE)
 features_df['cik'] = features_df['cik'].astype(int).map(lambda n: f"{n:010d}")
 
-for path in SEC_DIR.iterdir():
+for path in RAW_EDGAR_DIR.iterdir():
     folder = path / "10-K"
     cik_df = features_df[features_df['cik'] == path.name]
     
     if cik_df.empty:
-        years = [find_year(p.name) for p in folder.iterdir()]
+        years = [filing_year(p.name) for p in folder.iterdir()]
     else:
         a = cik_df["date_a"].tolist()
         a.append(cik_df["date_b"].iloc[-1])
         a = [i[:4] for i in a]
         
-        # p.name is the cik
-        years = [str(find_year(p.name)) for p in folder.iterdir() if not str(find_year(p.name)) in a]
+        # p.name is the accession
+        years = [filing_year(p.name) for p in folder.iterdir() if not filing_year(p.name) in a]
         
     rows = [[path.name, year] for year in years]
     for row in rows:
@@ -48,4 +61,4 @@ for path in SEC_DIR.iterdir():
 
 print(df)
 
-df.to_csv(TABLES_DIR / "missing_years.csv")
\ No newline at end of file
+df.to_csv(INTERIM_FEATURES_DIR / "missing_years.csv")
\ No newline at end of file
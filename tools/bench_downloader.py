@@ -0,0 +1,155 @@
+from risk_factor_pred.edgar import downloader as sd
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import deque
+from pathlib import Path
+import argparse
+import tempfile
+import threading
+import random
+import json
+import time
+import re
+
+"""
+Offline benchmark of the pooled downloader against a local stand-in for EDGAR.
+
+Starts a threaded HTTP server that serves submissions JSON and synthetic full
+submissions under the same paths as data.sec.gov / www.sec.gov, answers 429 when
+more than `--limit` requests arrive within one second and injects random 503s.
+Runs `download_pooled()` into a temporary RAW_EDGAR_DIR and reports throughput,
+the most requests seen in any one-second window, the 429/503 counts and whether
+every filing arrived intact. Exits with status 1 if the rate limit was exceeded
+or a filing is missing or corrupt.
+
+    python tools/bench_downloader.py --ciks 20 --filings 5 --size 2000000
+"""
+
+_SUBMISSIONS_RE = re.compile(r"^/submissions/CIK(\d{10})\.json$")
+_FILING_RE = re.compile(r"^/Archives/edgar/data/(\d+)/(\d{18})/([\d-]+)\.txt$")
+
+def accessions(cik: int, n_filings: int) -> list:
+    return [f"{cik:010d}-{10 + i:02d}-{i:06d}" for i in range(n_filings)]
+
+def filing_body(accession: str, size: int) -> bytes:
+    """
+    Deterministic filing body of `size` bytes, so downloads can be verified.
+    """
+    line = f"<SEC-DOCUMENT>{accession}.txt : 20100315\n".encode()
+    return (line * (size // len(line) + 1))[:size]
+
+def make_server(n_filings: int, size: int, limit: int, fail_rate: float, seed: int = 0):
+    """
+    Return a ThreadingHTTPServer on a free localhost port; request times and
+    status counts are collected in `server.stats`.
+    """
+    stats = {"times": [], "200": 0, "429": 0, "503": 0}
+    window = deque()
+    lock = threading.Lock()
+    rng = random.Random(seed)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body=b"", headers=()):
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in headers:
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            now = time.monotonic()
+            with lock:
+                stats["times"].append(now)
+                while window and now - window[0] >= 1.0:
+                    window.popleft()
+                window.append(now)
+                throttled = len(window) > limit
+                failed = not throttled and rng.random() < fail_rate
+                stats["429"] += throttled
+                stats["503"] += failed
+                stats["200"] += not (throttled or failed)
+            if throttled:
+                return self._send(429, headers=[("Retry-After", "1")])
+            if failed:
+                return self._send(503)
+
+            m = _SUBMISSIONS_RE.match(self.path)
+            if m:
+                accs = accessions(int(m.group(1)), n_filings)
+                recent = {
+                    "accessionNumber": accs + [accs[0] + "-A"],
+                    "form": ["10-K"] * len(accs) + ["10-K/A"],
+                    "filingDate": [f"20{a[11:13]}-03-15" for a in accs] + ["2015-06-01"],
+                }
+                body = json.dumps({"cik": m.group(1), "filings": {"recent": recent, "files": []}}).encode()
+                return self._send(200, body, [("Content-Type", "application/json")])
+
+            m = _FILING_RE.match(self.path)
+            if m:
+                return self._send(200, filing_body(m.group(3), size), [("Content-Type", "text/plain")])
+            self._send(404)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.stats = stats
+    return server
+
+def max_per_window(times, width: float = 1.0) -> int:
+    """
+    Largest number of requests in any half-open window of `width` seconds.
+    """
+    best = lo = 0
+    for hi, t in enumerate(times):
+        while t - times[lo] >= width:
+            lo += 1
+        best = max(best, hi - lo + 1)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ciks", type=int, default=10)
+    parser.add_argument("--filings", type=int, default=5, help="10-K filings per CIK")
+    parser.add_argument("--size", type=int, default=1_000_000, help="bytes per filing")
+    parser.add_argument("--limit", type=int, default=10, help="server-side requests per second before 429 (SEC: 10)")
+    parser.add_argument("--fail-rate", type=float, default=0.02, help="share of requests answered with 503")
+    args = parser.parse_args()
+
+    server = make_server(args.filings, args.size, args.limit, args.fail_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    sd.SEC_WWW = sd.SEC_DATA = base
+
+    ciks = [str(100000 + i) for i in range(args.ciks)]
+    with tempfile.TemporaryDirectory() as tmp:
+        sd.RAW_EDGAR_DIR = Path(tmp)
+        start = time.perf_counter()
+        sd.download_pooled(ciks)
+        elapsed = time.perf_counter() - start
+
+        bad = 0
+        for cik in ciks:
+            for acc in accessions(int(cik), args.filings):
+                path = sd.filing_path(cik.zfill(10), acc)
+                if not path.is_file() or path.read_bytes() != filing_body(acc, args.size):
+                    bad += 1
+        leftovers = list(Path(tmp).rglob("*.part"))
+
+    server.shutdown()
+    stats = server.stats
+    peak = max_per_window(sorted(stats["times"]))
+    n_files = args.ciks * args.filings
+    print(
+        f"\n{n_files} filings in {elapsed:.1f}s ({n_files / elapsed:.2f} filings/s, "
+        f"{n_files * args.size / elapsed / 1e6:.1f} MB/s) | {len(stats['times'])} requests, "
+        f"peak {peak} in 1s (limit {args.limit}) | 429: {stats['429']}, 503: {stats['503']} | "
+        f"missing/corrupt: {bad}, partial files left: {len(leftovers)}"
+    )
+    raise SystemExit(1 if peak > args.limit or bad or leftovers else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+from risk_factor_pred.config import RETURN_HORIZONS
+from risk_factor_pred.datasets import storage as st
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import argparse
+import tempfile
+import time
+
+"""
+Round-trip check and read benchmark of the typed Parquet storage against CSV.
+
+Writes a synthetic features checkpoint (CSV, as step 04 does) with mixed CIK
+spellings, publishes it with `st.publish_features()`, and builds a final panel
+with the RETURN_HORIZONS columns. It then times loading the panel for step 07
+from CSV (with the old `format="mixed", dayfirst=True` date parsing) and from
+the store, both in full and with a column projection, and reports the sizes on
+disk. Exits with status 1 if the store does not give back the CSV values (CIKs
+as integers, float32 tolerance for floats).
+
+    python tools/bench_storage.py --rows 200000
+"""
+
+def synthetic_features(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    ciks = rng.integers(1000, 2_000_000, n_rows)
+    date_a = pd.Timestamp("2007-01-01") + pd.to_timedelta(rng.integers(0, 365 * 19, n_rows), "D")
+    spelled = np.where(rng.random(n_rows) < 0.5, pd.Series(ciks).astype(str).str.zfill(10), pd.Series(ciks).astype(str))
+    len_a, len_b = rng.integers(1000, 40000, n_rows), rng.integers(1000, 40000, n_rows)
+    distance = rng.integers(0, 20000, n_rows)
+    return pd.DataFrame({
+        "cik": spelled,
+        "date_a": date_a.strftime("%Y-%m-%d"),
+        "date_b": (date_a - pd.Timedelta(days=365)).strftime("%Y-%m-%d"),
+        "distance": distance,
+        "distance_capped": False,
+        "levenshtein": 1 - distance / (len_a + len_b),
+        "len_a": len_a,
+        "len_b": len_b,
+        "sentiment": rng.normal(0, 0.2, n_rows),
+        "digest_a": [f"{x:064x}" for x in rng.integers(0, 2**62, n_rows)],
+        "digest_b": [f"{x:064x}" for x in rng.integers(0, 2**62, n_rows)],
+    })
+
+def size_mb(path: Path) -> float:
+    files = [path] if path.is_file() else [p for p in path.rglob("*") if p.is_file()]
+    return sum(p.stat().st_size for p in files) / 1e6
+
+def timed(fn, repeat: int = 3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    return out, best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        st.FEATURES_FILE = root / "features.csv"
+        st.FEATURES_STORE = root / "features"
+        synthetic_features(args.rows).to_csv(st.FEATURES_FILE, index=False)
+
+        features, t_pub = timed(st.load_features, repeat=1)
+        panel = features.copy()
+        rng = np.random.default_rng(1)
+        for period, months in RETURN_HORIZONS:
+            panel[f"{period}_{months}m_ret"] = rng.normal(5, 40, len(panel))
+
+        panel_csv, panel_store = root / "final_dataset.csv", root / "final_dataset"
+        panel.to_csv(panel_csv, index=False)
+        st.write_table(panel, panel_store)
+
+        def read_csv():
+            df = pd.read_csv(panel_csv)
+            for col in ("date_a", "date_b"):
+                df[col] = pd.to_datetime(df[col], format="mixed", dayfirst=True)
+            return df
+
+        columns = ["cik", "date_a", "levenshtein", "sentiment", "len_a", "len_b"] + [f"{p}_{m}m_ret" for p, m in RETURN_HORIZONS]
+        from_csv, t_csv = timed(read_csv)
+        from_store, t_store = timed(lambda: st.read_table(panel_store))
+        _, t_proj = timed(lambda: st.read_table(panel_store, columns))
+        _, t_year = timed(lambda: st.read_table(panel_store, columns, years=[2020]))
+
+        print(f"{args.rows} rows; publish_features {t_pub:.2f}s")
+        print(f"panel on disk: CSV {size_mb(panel_csv):.1f} MB | Parquet {size_mb(panel_store):.1f} MB")
+        print(f"load panel: CSV {t_csv * 1000:.0f} ms | store {t_store * 1000:.0f} ms | "
+              f"{len(columns)} columns {t_proj * 1000:.0f} ms | one year {t_year * 1000:.0f} ms")
+
+        # the store orders rows by (filing year, cik, date_a); compare on that order
+        from_csv["cik"] = st.cik_to_int(from_csv["cik"])
+        from_csv["year"] = from_csv["date_a"].dt.year
+        from_csv = from_csv.sort_values(["year", "cik", "date_a"], kind="stable").drop(columns="year").reset_index(drop=True)
+        same = list(from_csv.columns) == list(from_store.columns)
+        for col in from_csv.columns if same else []:
+            a, b = from_csv[col], from_store[col]
+            if pd.api.types.is_float_dtype(b):
+                same &= np.allclose(a.to_numpy("float64"), b.to_numpy("float64"), rtol=1e-6, atol=1e-6, equal_nan=True)
+            else:
+                same &= bool((a.to_numpy() == b.to_numpy()).all())
+        print(f"store matches CSV: {same} (dtypes {dict(from_store.dtypes.astype(str))})")
+    raise SystemExit(0 if same else 1)
+
+if __name__ == "__main__":
+    main()
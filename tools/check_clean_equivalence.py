@@ -0,0 +1,68 @@
+from risk_factor_pred.config import RAW_EDGAR_DIR
+from risk_factor_pred.text import clean as hc
+import argparse
+import difflib
+import random
+import time
+
+"""
+Golden-output check of the fused cleaner against the reference `clean_html()`.
+
+Runs both cleaners on raw filings under RAW_EDGAR_DIR (all of them, or a random
+sample) and reports every filing whose cleaned text differs, with the first
+differing lines. Exits with status 1 if any filing differs.
+
+    python tools/check_clean_equivalence.py --sample 200
+"""
+
+def raw_filings():
+    """
+    Return the paths of every raw full-submission.txt under RAW_EDGAR_DIR.
+    """
+    return sorted(RAW_EDGAR_DIR.glob("*/10-K/*/full-submission.txt"))
+
+def compare(path):
+    """
+    Clean one filing with both cleaners; return (diff lines or None, reference secs, fused secs).
+    """
+    content = path.read_text(encoding="utf-8")
+
+    start = time.perf_counter()
+    reference = hc.clean_html(content)
+    t_ref = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fused = hc.clean_html_fused(content)
+    t_fused = time.perf_counter() - start
+
+    if reference == fused:
+        return None, t_ref, t_fused
+    diff = difflib.unified_diff(reference.splitlines(), fused.splitlines(), "clean_html", "clean_html_fused", n=1, lineterm="")
+    return list(diff)[:20], t_ref, t_fused
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sample", type=int, default=None, help="Check a random sample of N filings.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    paths = raw_filings()
+    if args.sample is not None and args.sample < len(paths):
+        paths = random.Random(args.seed).sample(paths, args.sample)
+
+    mismatches = 0
+    total_ref = total_fused = 0.0
+    for path in paths:
+        diff, t_ref, t_fused = compare(path)
+        total_ref += t_ref
+        total_fused += t_fused
+        if diff is not None:
+            mismatches += 1
+            print(f"[DIFF] {path}")
+            print("\n".join(diff))
+
+    print(f"{len(paths)} filings, {mismatches} differ | clean_html {total_ref:.1f}s, clean_html_fused {total_fused:.1f}s")
+    raise SystemExit(1 if mismatches else 0)
+
+if __name__ == "__main__":
+    main()
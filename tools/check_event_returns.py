@@ -0,0 +1,74 @@
+from risk_factor_pred.config import EVENT_WINDOWS, EVENT_MIN_COVERAGE
+from risk_factor_pred.datasets import event_study as es
+from risk_factor_pred.wrds import crsp_returns as cr
+from crsp_standin import build_standin, standin_engine, trading_days
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import argparse
+import tempfile
+import tracemalloc
+import time
+
+"""
+Golden-output check of the vectorized CARs against per-event filtering.
+
+Builds the SQLite CRSP stand-in with daily tables (see `crsp_standin.py`), pulls
+it with `cr.pull_daily_returns()` into partitioned Parquet, draws random filing
+dates (some on weekends, some for firms without returns, some near the ends of
+the calendar) and computes the EVENT_WINDOWS CARs with `es.event_returns()` and
+`es.event_returns_reference()`. It reports time and peak memory of both, and
+exits with status 1 if they differ (absolute tolerance 1e-9).
+
+    python tools/check_event_returns.py --ciks 200 --events 2000
+"""
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ciks", type=int, default=200)
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=50, help="CIKs per daily partition")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        ciks = build_standin(root, args.ciks, daily=True)
+        cr.RETURNS_DAILY_DIR = root / "daily"
+        cr.MARKET_DAILY_FILE = root / "market_daily.parquet"
+
+        start = time.perf_counter()
+        cr.pull_daily_returns(ciks, engine=standin_engine(root, 0), batch_size=args.batch_size)
+        print(f"pull: {time.perf_counter() - start:.2f}s, {len(cr.daily_partitions())} partitions")
+
+        rng = np.random.default_rng(0)
+        days = pd.date_range(trading_days()[0] - pd.Timedelta(days=5), trading_days()[-1] + pd.Timedelta(days=5))
+        sim_df = pd.DataFrame({
+            "cik": rng.choice([int(c) for c in ciks], args.events),
+            "date_a": days[rng.integers(0, len(days), args.events)],
+        })
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        fast = es.event_returns(sim_df)
+        t_fast = time.perf_counter() - start
+        m_fast = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+
+        daily = pd.concat([pd.read_parquet(p) for p in cr.daily_partitions()], ignore_index=True)
+        start = time.perf_counter()
+        reference = es.event_returns_reference(sim_df, daily, cr.load_market(), EVENT_WINDOWS, EVENT_MIN_COVERAGE)
+        t_ref = time.perf_counter() - start
+
+    cols = [es.window_label(s, e) for s, e in EVENT_WINDOWS]
+    same_keys = fast[["cik", "date_a", "event_date"]].equals(reference[["cik", "date_a", "event_date"]])
+    same = same_keys and all(
+        np.allclose(fast[c].to_numpy(), reference[c].to_numpy(dtype="float64"), rtol=0, atol=1e-9, equal_nan=True) for c in cols
+    )
+
+    print(f"{args.events} events, {len(daily)} daily returns; CARs present: " + ", ".join(f"{c} {fast[c].notna().sum()}" for c in cols))
+    print(f"event_returns_reference {t_ref:.2f}s | event_returns {t_fast:.2f}s, peak {m_fast:.0f} MB")
+    print(f"identical keys: {same_keys}, CARs within 1e-9: {same}")
+    raise SystemExit(0 if same else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+from risk_factor_pred.config import RETURN_HORIZONS
+from risk_factor_pred.datasets import build_panel as bp, storage as st
+from risk_factor_pred.wrds import crsp_returns as cr
+import numpy as np
+import pandas as pd
+import argparse
+import tracemalloc
+import time
+
+"""
+Golden-output check of the prefix-sum window returns against the reference merge.
+
+Runs `merge_return_reference()` (chained over RETURN_HORIZONS, as step 06 did)
+and `add_window_returns()` on the stored features and the cached returns, or on a
+synthetic panel with --synthetic. It reports time and peak memory of both, and
+exits with status 1 if the kept rows or the window returns differ (relative
+tolerance 1e-9).
+
+    python tools/check_window_returns.py
+    python tools/check_window_returns.py --synthetic 5000 --rows 100000
+"""
+
+def synthetic_panel(n_ciks: int, n_rows: int, seed: int = 0):
+    """
+    Monthly returns for `n_ciks` firms over random spans (with some missing returns)
+    and `n_rows` feature rows on random days, some for firms without returns.
+    """
+    rng = np.random.default_rng(seed)
+    months = pd.date_range("2004-01-31", "2026-06-30", freq="ME")
+    frames = []
+    for cik in range(1000, 1000 + n_ciks):
+        first = rng.integers(0, len(months) - 1)
+        dates = months[first:rng.integers(first, len(months)) + 1]
+        ret = rng.normal(0.01, 0.08, len(dates))
+        ret[rng.random(len(dates)) < 0.02] = np.nan
+        frames.append(pd.DataFrame({"cik": cik, "date": dates, "ret": ret}))
+    return_df = pd.concat(frames, ignore_index=True)
+    return_df["retPlusOne"] = return_df["ret"] + 1
+
+    days = pd.date_range("2005-01-01", "2026-12-31", freq="D")
+    sim_df = pd.DataFrame({
+        "cik": rng.integers(1000, 1000 + n_ciks + n_ciks // 50, n_rows),
+        "date_a": days[rng.integers(0, len(days), n_rows)],
+    })
+    sim_df["date_b"] = sim_df["date_a"]
+    return sim_df, return_df
+
+def run(fn, sim_df, return_df):
+    """
+    Apply `fn` to `sim_df` and `return_df`; return (result, seconds, peak MB).
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    sim_df = fn(sim_df, return_df)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return sim_df, elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--synthetic", type=int, default=None, metavar="N_CIKS", help="Use a synthetic panel with N_CIKS firms.")
+    parser.add_argument("--rows", type=int, default=50_000, help="Feature rows of the synthetic panel.")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        sim_df, return_df = synthetic_panel(args.synthetic, args.rows)
+    else:
+        sim_df, return_df = bp.datatype_setup(st.load_features(), cr.load_returns())
+
+    def chained_reference(sim_df, return_df):
+        for period, months in RETURN_HORIZONS:
+            sim_df = bp.merge_return_reference(sim_df, return_df, months, period)
+        return sim_df
+
+    reference, t_ref, m_ref = run(chained_reference, sim_df.copy(), return_df)
+    prefix, t_pre, m_pre = run(lambda s, r: bp.add_window_returns(s, r, RETURN_HORIZONS), sim_df.copy(), return_df)
+
+    # a single pass resets the index once, chained merges once per horizon
+    reference, prefix = reference.reset_index(drop=True), prefix.reset_index(drop=True)
+    cols = [f"{period}_{months}m_ret" for period, months in RETURN_HORIZONS]
+    same_rows = reference.drop(columns=cols).equals(prefix.drop(columns=cols))
+    same_values = same_rows and all(np.allclose(reference[c], prefix[c], rtol=1e-9, atol=1e-9) for c in cols)
+
+    print(f"{len(sim_df)} feature rows, {len(return_df)} returns -> {len(reference)} rows kept")
+    print(f"merge_return_reference {t_ref:.2f}s, peak {m_ref:.0f} MB | add_window_returns {t_pre:.2f}s, peak {m_pre:.0f} MB")
+    print(f"identical rows: {same_rows}, window returns within 1e-9: {same_values}")
+    raise SystemExit(0 if same_values else 1)
+
+if __name__ == "__main__":
+    main()
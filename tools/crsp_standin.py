@@ -0,0 +1,237 @@
+from risk_factor_pred.wrds import crsp_returns as cr
+from sqlalchemy import create_engine, event
+from pathlib import Path
+import pandas as pd
+import numpy as np
+import argparse
+import tempfile
+import sqlite3
+import random
+import time
+
+"""
+Offline SQLite stand-in for the WRDS tables used by `crsp_returns`.
+
+Builds `crsp.msf`, `crsp.ccmxpf_linktable` and `comp.company` (and, with
+`daily=True`, `crsp.dsf` and `crsp.dsi`) as two attached SQLite databases
+(schemas `crsp` and `comp`) filled with synthetic firms. The
+firms cover the cases the query has to handle: link ranges that end, non-primary
+and non-LU links, several PERMNOs per CIK, missing returns and CIKs with no link.
+The script then pulls returns one query per CIK and in batches, with an optional
+simulated round-trip latency per query. It checks that both modes give the same
+panel and reports the query counts and timings. With --refresh, it instead
+checks that an incremental `refresh_returns()` after a monthly update (with link
+changes) matches a full pull. Exits with status 1 if the panels differ.
+
+    python tools/crsp_standin.py --ciks 2000 --latency-ms 50
+    python tools/crsp_standin.py --ciks 2000 --refresh
+"""
+
+_SCHEMA = {
+    "crsp": """
+        CREATE TABLE msf (permno INTEGER, date TEXT, ret REAL);
+        CREATE INDEX msf_permno ON msf (permno, date);
+        CREATE TABLE ccmxpf_linktable (
+            gvkey TEXT, lpermno INTEGER, linktype TEXT, linkprim TEXT, linkdt TEXT, linkenddt TEXT
+        );
+        CREATE INDEX link_gvkey ON ccmxpf_linktable (gvkey);
+        CREATE TABLE dsf (permno INTEGER, date TEXT, ret REAL);
+        CREATE INDEX dsf_permno ON dsf (permno, date);
+        CREATE TABLE dsi (date TEXT PRIMARY KEY, vwretd REAL, ewretd REAL, sprtrn REAL);
+    """,
+    "comp": """
+        CREATE TABLE company (gvkey TEXT PRIMARY KEY, cik TEXT, conm TEXT);
+        CREATE INDEX company_cik ON company (cik);
+    """,
+}
+
+def month_ends(start: str = "2004-01-31", end: str = "2026-06-30") -> list:
+    return [d.strftime("%Y-%m-%d") for d in pd.date_range(start, end, freq="ME")]
+
+def trading_days(start: str = "2004-01-01", end: str = "2026-06-30") -> pd.DatetimeIndex:
+    return pd.bdate_range(start, end)
+
+def _daily_rows(permno: int, first: str, last: str, days: pd.DatetimeIndex, rng: np.random.Generator) -> list:
+    """
+    Daily returns of `permno` over [first, last]: about 1% of days missing and 2% with a null return.
+    """
+    span = days[(days >= first) & (days <= last)]
+    span = span[rng.random(len(span)) >= 0.01]
+    ret = np.round(rng.normal(0.0004, 0.02, len(span)), 6).astype(object)
+    ret[rng.random(len(span)) < 0.02] = None
+    return list(zip([permno] * len(span), span.strftime("%Y-%m-%d"), ret))
+
+def build_standin(root: Path, n_ciks: int, seed: int = 0, daily: bool = False) -> list:
+    """
+    Create `root/crsp.db` and `root/comp.db` and return the 10-digit CIKs of the synthetic firms.
+    With `daily`, also fill `crsp.dsf` over each PERMNO's months and `crsp.dsi` over every business day.
+    """
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+    months = month_ends()
+    days = trading_days()
+    msf, dsf, links, companies = [], [], [], []
+    ciks = []
+    permno = 10000
+    for i in range(n_ciks):
+        cik = str(1000 + i).zfill(10)
+        gvkey = str(100000 + i)
+        ciks.append(cik)
+        companies.append((gvkey, cik, f"FIRM {i}"))
+        kind = i % 7
+        if kind == 6:
+            # CIK without any link
+            continue
+
+        n_permnos = 2 if kind == 5 else 1
+        for k in range(n_permnos):
+            permno += 1
+            first = rng.randrange(0, len(months) // 2)
+            last = rng.randrange(first, len(months))
+            for m in months[first:last + 1]:
+                msf.append((permno, m, None if rng.random() < 0.02 else round(rng.gauss(0.01, 0.08), 6)))
+            if daily:
+                dsf += _daily_rows(permno, months[first][:8] + "01", months[last], days, np_rng)
+
+            linkdt = months[first][:8] + "01"
+            linkenddt = None if kind in (0, 5) else months[rng.randrange(first, len(months))]
+            linktype, linkprim = "LU", "C" if k else "P"   # second PERMNO: overlapping non-primary link
+            if kind == 3:
+                linktype = "LN"            # excluded link type
+            elif kind == 4:
+                linkprim = "J"             # excluded secondary link
+            links.append((gvkey, permno, linktype, linkprim, linkdt, linkenddt))
+
+    for schema, ddl in _SCHEMA.items():
+        conn = sqlite3.connect(root / f"{schema}.db")
+        conn.executescript(ddl)
+        conn.close()
+
+    conn = sqlite3.connect(root / "crsp.db")
+    with conn:
+        conn.executemany("INSERT INTO msf VALUES (?, ?, ?)", msf)
+        conn.executemany("INSERT INTO ccmxpf_linktable VALUES (?, ?, ?, ?, ?, ?)", links)
+        if daily:
+            conn.executemany("INSERT INTO dsf VALUES (?, ?, ?)", dsf)
+            mkt = np.round(np_rng.normal(0.0003, 0.01, (len(days), 3)), 6)
+            conn.executemany("INSERT INTO dsi VALUES (?, ?, ?, ?)", zip(days.strftime("%Y-%m-%d"), *mkt.T.tolist()))
+    conn.close()
+    conn = sqlite3.connect(root / "comp.db")
+    with conn:
+        conn.executemany("INSERT INTO company VALUES (?, ?, ?)", companies)
+    conn.close()
+    return ciks
+
+def hold_back(root: Path, after: str) -> None:
+    """
+    Move the `crsp.msf` rows after `after` aside, as if CRSP had not published them yet.
+    """
+    conn = sqlite3.connect(root / "crsp.db")
+    with conn:
+        conn.execute("CREATE TABLE msf_later AS SELECT * FROM msf WHERE date > ?", (after,))
+        conn.execute("DELETE FROM msf WHERE date > ?", (after,))
+    conn.close()
+
+def publish_update(root: Path, n_link_changes: int, seed: int = 1) -> list:
+    """
+    Publish the held-back months and change the links of `n_link_changes` firms
+    (ended links are reopened, open links get an end date). Returns the changed CIKs.
+    """
+    rng = random.Random(seed)
+    conn = sqlite3.connect(root / "crsp.db")
+    conn.execute(f"ATTACH DATABASE '{root / 'comp.db'}' AS comp")
+    with conn:
+        conn.execute("INSERT INTO msf SELECT * FROM msf_later")
+        conn.execute("DROP TABLE msf_later")
+        rows = conn.execute(
+            "SELECT l.rowid, l.linkenddt, c.cik FROM ccmxpf_linktable l JOIN comp.company c ON l.gvkey = c.gvkey "
+            "WHERE l.linktype = 'LU' AND l.linkprim = 'P'"
+        ).fetchall()
+        changed = rng.sample(rows, min(n_link_changes, len(rows)))
+        for rowid, linkenddt, _ in changed:
+            conn.execute("UPDATE ccmxpf_linktable SET linkenddt = ? WHERE rowid = ?", (None if linkenddt else "2015-06-30", rowid))
+    conn.close()
+    return sorted({cik for _, _, cik in changed})
+
+def standin_engine(root: Path, latency_ms: float = 0.0):
+    """
+    Return a SQLAlchemy engine on the stand-in with `crsp` and `comp` attached.
+    `engine.queries` counts executed statements; each one sleeps `latency_ms` first.
+    """
+    engine = create_engine("sqlite://")
+    engine.queries = 0
+
+    @event.listens_for(engine, "connect")
+    def _attach(dbapi_conn, _):
+        for schema in _SCHEMA:
+            dbapi_conn.execute(f"ATTACH DATABASE '{root / f'{schema}.db'}' AS {schema}")
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _round_trip(*_):
+        engine.queries += 1
+        if latency_ms:
+            time.sleep(latency_ms / 1000)
+
+    return engine
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ciks", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="simulated round trip per query")
+    parser.add_argument("--refresh", action="store_true", help="benchmark refresh_returns() after a monthly update instead")
+    args = parser.parse_args()
+    if args.refresh:
+        return refresh_benchmark(args)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        ciks = build_standin(root, args.ciks)
+        cr.RETURNS_CACHE = root / "returns.parquet"
+        cr.RETURNS_LINKS = root / "crsp_links.parquet"
+
+        results = {}
+        for label, batch_size in (("per-CIK", None), ("batched", args.batch_size)):
+            engine = standin_engine(root, args.latency_ms)
+            start = time.perf_counter()
+            results[label] = cr.df_with_returns(ciks, engine=engine, batch_size=batch_size)
+            print(f"== {label}: {engine.queries} queries, {time.perf_counter() - start:.2f}s, {len(results[label])} rows")
+
+        cached = cr.load_returns()
+        same = results["per-CIK"].equals(results["batched"]) and cached.equals(results["batched"])
+        print(f"panels identical: {same} | cache {cr.RETURNS_CACHE.name}: {len(cached)} rows, dtypes {dict(cached.dtypes.astype(str))}")
+    raise SystemExit(0 if same else 1)
+
+def refresh_benchmark(args):
+    """
+    Full pull with the last month held back, then publish it (plus link changes) and
+    compare `refresh_returns()` with a full pull from scratch on the updated tables.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        ciks = build_standin(root, args.ciks)
+        cr.RETURNS_CACHE = root / "returns.parquet"
+        cr.RETURNS_LINKS = root / "crsp_links.parquet"
+
+        hold_back(root, month_ends()[-2])
+        cr.df_with_returns(ciks, engine=standin_engine(root), batch_size=args.batch_size)
+        changed = publish_update(root, n_link_changes=max(1, args.ciks // 100))
+
+        engine = standin_engine(root, args.latency_ms)
+        start = time.perf_counter()
+        refreshed = cr.refresh_returns(ciks, engine=engine, batch_size=args.batch_size)
+        print(f"== refresh: {engine.queries} queries, {time.perf_counter() - start:.2f}s, {len(changed)} link changes")
+
+        cr.RETURNS_CACHE = root / "full.parquet"
+        cr.RETURNS_LINKS = root / "full_links.parquet"
+        engine = standin_engine(root, args.latency_ms)
+        start = time.perf_counter()
+        full = cr.df_with_returns(ciks, engine=engine, batch_size=args.batch_size)
+        print(f"== full pull: {engine.queries} queries, {time.perf_counter() - start:.2f}s")
+
+        same = refreshed.equals(full)
+        print(f"refreshed panel identical to full pull: {same} ({len(full)} rows)")
+    raise SystemExit(0 if same else 1)
+
+if __name__ == "__main__":
+    main()